@@ -1,5 +1,4 @@
 from mesa import Agent
-import random
 import numpy as np
 from mesa_com.communication import CommunicatingAgent, MessagePerformative, Message
 
@@ -23,6 +22,12 @@ class Robot(Agent):
         self.knowledge = {}
         self.percepts = {}
         self.model = model
+        # own random generator, given by a scheduler deliberating in parallel (None : the model's one)
+        self.rng = None
+
+    @property
+    def random(self):
+        return self.rng if self.rng is not None else self.model.random
     
     def update_knowledge(self):
         for k,v in self.percepts.items():
@@ -34,7 +39,7 @@ class Robot(Agent):
         else:
             possible_steps = self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False)
             possible_steps = [pos for pos in possible_steps if pos[0] <= self.border] # Cannot go further east
-            return random.choice(possible_steps)
+            return self.random.choice(possible_steps)
         
     def get_accessible_pos(self, knowledge):
         pos = self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False)
@@ -44,9 +49,34 @@ class Robot(Agent):
         pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["red"]]]
         return pos
 
+    def move_towards(self, knowledge, target, candidates=None):
+        """
+        Choose the next cell towards target among the candidates (by default the accessible cells)
+        Uses the grid's cached distance field, which follows the radioactivity limit of the robot
+        """
+        pos = self.get_accessible_pos(knowledge) if candidates is None else candidates
+        if len(pos) == 0:
+            return knowledge["pos"]
+        field = self.model.grid.get_distance_field(target, knowledge["radioactivity_limit"])
+        # -1 : target out of reach from this cell
+        distances = [field[p] if field[p] >= 0 else np.inf for p in pos]
+        if min(distances) == np.inf: # target out of reach, fall back on the Manhattan distance
+            distances = [self.model.grid.get_distance(p, target) for p in pos]
+        best = min(distances)
+        all_closest_pos = [p for p, d in zip(pos, distances) if d == best]
+        return self.random.choice(all_closest_pos)
+
+    def closest_waste(self, knowledge, exclude=()):
+        """
+        Get the waste of the robot's color closest to it among the ones it knows, None if there is none
+        exclude is a container of wastes to ignore (e.g. already claimed by other robots)
+        """
+        wastes = knowledge["waste_index"][knowledge["color"]].nearest(self.pos, 1, exclude)
+        return wastes[0] if len(wastes) > 0 else None
+
     def idle(self):
         pos = self.get_accessible_pos(self.knowledge)
-        pos = random.choice(pos) if len(pos) > 0 else self.knowledge["pos"]
+        pos = self.random.choice(pos) if len(pos) > 0 else self.knowledge["pos"]
         return pos
     
     def deliberate(self, knowledge=None): ### ONLY FOR GREEN AND YELLOW ROBOTS
@@ -55,22 +85,15 @@ class Robot(Agent):
         # if not carrying 2 wastes, move towards (1 cell at a time) the closest waste of its color if not already on it
         if len(self.inventory) < 2:
             self.action = "move"
-            wastes = knowledge["wastes"][knowledge["color"]]
-            if len(wastes) == 0: # No waste of its color, then idle : move to a random cell
+            closest_waste = self.closest_waste(knowledge)
+            if closest_waste is None: # No waste of its color, then idle : move to a random cell
                 pos = self.get_accessible_pos(knowledge)
-                pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                 return {"action": "move", "pos": pos, "objective": "idle"}
-            closest_waste = min(wastes, key=lambda w: self.model.grid.get_distance(self.pos, w.pos))
             if closest_waste.pos != knowledge["pos"]:
                 action = "move"
                 # move one cell towards the closest waste
-                pos = self.get_accessible_pos(knowledge)
-                distances = [self.model.grid.get_distance(p, closest_waste.pos) for p in pos] if len(pos) > 0 else None
-                if distances is not None:
-                    all_closest_pos = [p for p in pos if self.model.grid.get_distance(p, closest_waste.pos) == min(distances)]
-                    pos = random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
-                else:
-                    pos = knowledge["pos"]
+                pos = self.move_towards(knowledge, closest_waste.pos)
                 return {"action": action, "pos": pos, "objective": f"pick up the closest waste which is in {closest_waste.pos}"}
             else:
                 action = "pick_up"
@@ -107,6 +130,7 @@ class GreenRobot(Robot):
 
         self.knowledge = {
             "wastes": self.model.grid.get_wastes(),
+            "waste_index": self.model.grid.get_waste_indexes(),
             "robots": self.model.grid.get_robots(),
             "inventory": [],
             "pos": self.pos,
@@ -121,23 +145,85 @@ class GreenRobot(Robot):
 
 class CommunicatingRobot(CommunicatingAgent):
     def __init__(self, unique_id, model, name, **kwargs):
-        CommunicatingAgent.__init__(self, unique_id=unique_id, model=model, name=name)
+        # every message is handled once, in the step it is read : the mailbox does not keep them
+        CommunicatingAgent.__init__(self, unique_id=unique_id, model=model, name=name, drop_after_consume=True)
+        # wastes claimed by other robots, excluded from the search, with the step the claim was received
+        self.claimed_wastes = {}
+        # waste claimed by the robot itself
+        self.target_waste = None
         self.argued = False
         self.confirmed = False
-        self.messages_sent = []
+        # step at which the robot started waiting for a partner (ARGUE sent or received), None if not waiting
+        self.handshake_start = None
+        # the messages themselves are only kept by the model's message log, if enabled
+        self.last_performative = None
+        self.nb_messages_sent = 0
+        # broadcasts are sent to the robots of the same color
+        self.subscribe(self.type)
+
+    def update_claimed_wastes(self, new_messages):
+        """
+        Add the wastes claimed in the new messages, and forget the ones which no longer exist
+        With delayed messages two robots can claim the same waste : the robot with the smallest name keeps it,
+        and a claim is forgotten after the model's message_timeout steps, as its sender may have changed its target
+        """
+        delayed = self.model.message_latency > 0
+        step = self.model.schedule.steps
+        for message in new_messages:
+            if message.get_performative() == MessagePerformative.INFORM_REF:
+                if delayed and message.get_content() == self.target_waste and self.get_name() < message.get_exp():
+                    continue
+                self.claimed_wastes[message.get_content()] = step
+        timeout = self.model.message_timeout
+        self.claimed_wastes = {w: received for w, received in self.claimed_wastes.items()
+                               if not w.suppressed and (timeout is None or step - received < timeout)}
+
+    def record_sent(self, message, n_recipients=1):
+        """
+        Keep track of a message sent, in the robot's counters and in the model's ones
+        A broadcast is counted once per recipient
+        """
+        if n_recipients == 0:
+            return
+        self.last_performative = message.get_performative()
+        self.nb_messages_sent += n_recipients
+        self.model.messages_count[self.type] += n_recipients
     
+    def check_handshake(self):
+        """
+        Give up the ARGUE/COMMIT handshake if it has not ended after the model's message_timeout steps :
+        with delayed messages the replies can come too late, the robot then starts a new one
+        """
+        if not (self.argued or self.confirmed or self.last_performative == MessagePerformative.ARGUE):
+            self.handshake_start = None
+            return
+        step = self.model.schedule.steps
+        if self.handshake_start is None:
+            self.handshake_start = step
+        elif self.model.message_timeout is not None and step - self.handshake_start >= self.model.message_timeout:
+            self.argued = False
+            self.confirmed = False
+            self.last_performative = None
+            self.handshake_start = None
+
+    def claim_waste(self, knowledge, waste):
+        """
+        Inform the other robots of the color that the robot is going to pick up waste
+        The claim is sent to the first other robot of the color at each step, the message service drops the repeated ones
+        """
+        self.target_waste = waste
+        for r in knowledge["robots"][knowledge["color"]]:
+            if r != self:
+                message = Message(self.get_name(), r.get_name(), MessagePerformative.INFORM_REF, waste)
+                self.record_sent(message, self.send_message(message))
+                return
+
     def deliberate(self, knowledge=None): ### ONLY FOR GREEN AND YELLOW ROBOTS
         if knowledge is None:
             knowledge = self.knowledge
 
         new_messages = self.get_new_messages()
-        messages = self.get_messages()
-        for message in messages:
-            if message.get_performative() == MessagePerformative.INFORM_REF:
-                content = message.get_content()
-                if content in knowledge["wastes"][knowledge["color"]]:
-                    knowledge["wastes"][knowledge["color"]].remove(content)
-        # print(knowledge["wastes"][knowledge["color"]])
+        self.update_claimed_wastes(new_messages)
         
         for message in new_messages:
             if message.get_performative() == MessagePerformative.ARGUE and not self.argued:
@@ -154,46 +240,36 @@ class CommunicatingRobot(CommunicatingAgent):
         if len(commited_robots) > 0:
             self.target_robot = min(commited_robots, key=lambda r: self.model.grid.get_distance(self.pos, r.pos))
             # broadcast to all other robots the cancel of the previous argue message
-            for r in knowledge["robots"][knowledge["color"]]:
-                if r != self and r != self.target_robot:
-                    self.send_message(Message(self.get_name(), r.get_name(), MessagePerformative.CANCEL, self))
-                    self.messages_sent.append(Message(self.get_name(), r.get_name(), MessagePerformative.CANCEL, self))
+            message = Message(self.get_name(), knowledge["color"], MessagePerformative.CANCEL, self)
+            self.record_sent(message, self.broadcast_message(message, knowledge["color"], (self.target_robot,)))
 
         
         for message in new_messages:
             if message.get_performative() == MessagePerformative.CANCEL and hasattr(self, "target_robot") and self.target_robot == message.get_content():
                 self.argued = False
                 self.confirmed = False
+        self.check_handshake()
 
         # if not carrying 2 wastes, move towards (1 cell at a time) the closest waste of its color if not already on it
         if len(self.inventory) < 2:
             self.action = "move"
-            wastes = knowledge["wastes"][knowledge["color"]]
-            if len(wastes) == 0: # No waste of its color, then idle : move to a random cell
+            closest_waste = self.closest_waste(knowledge, self.claimed_wastes)
+            if closest_waste is None: # No waste of its color, then idle : move to a random cell
                 if len(self.inventory)==0:
-                    pos = self.get_accessible_pos(knowledge)
-                    distances = [self.model.grid.get_distance(p, (knowledge["left_border"], knowledge["pos"][1])) for p in pos] if len(pos) > 0 else None
-                    if distances is not None:
-                        all_closest_pos = [p for p in pos if self.model.grid.get_distance(p, (knowledge["left_border"], knowledge["pos"][1])) == min(distances)]
-                        pos = random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
-                    else:
-                        pos = knowledge["pos"]
+                    pos = self.move_towards(knowledge, (knowledge["left_border"], knowledge["pos"][1]))
                     return {"action": "move", "pos": pos, "objective": "idle because no waste of its color", "target": None}
                 else: # if carrying one waste and can't find any other
                     if not self.argued:
-                        last_message_perf = self.messages_sent[-1].get_performative() if len(self.messages_sent) > 0 else None
-                        if last_message_perf != MessagePerformative.ARGUE:
+                        if self.last_performative != MessagePerformative.ARGUE:
                     # broadcast the fact that he has one waste, and can't find any other
-                            for r in knowledge["robots"][knowledge["color"]]:
-                                if r != self:
-                                    self.send_message(Message(self.get_name(), r.get_name(), MessagePerformative.ARGUE, self))
-                                    self.messages_sent.append(Message(self.get_name(), r.get_name(), MessagePerformative.ARGUE, self))
+                            message = Message(self.get_name(), knowledge["color"], MessagePerformative.ARGUE, self)
+                            self.record_sent(message, self.broadcast_message(message, knowledge["color"]))
                             # print(f"{self.get_name()} broadcasted the fact that he has one waste, and can't find any other")
                         return {"action": "move", "pos": self.idle(), "objective": "send message to other robots", "target": None}
                     elif not self.confirmed:
                         # send message to the robot he argued with to confirm that he is going to regroup with him
-                        self.send_message(Message(self.get_name(), self.target_robot.get_name(), MessagePerformative.COMMIT, self))
-                        self.messages_sent.append(Message(self.get_name(), self.target_robot.get_name(), MessagePerformative.COMMIT, self))
+                        message = Message(self.get_name(), self.target_robot.get_name(), MessagePerformative.COMMIT, self)
+                        self.record_sent(message, self.send_message(message))
                         self.confirmed = True
                         return {"action": "move", "pos": self.idle(), "objective": "send message to the robot he argued with", "target": self.target_robot}
                     else:
@@ -203,7 +279,7 @@ class CommunicatingRobot(CommunicatingAgent):
                             distances = [self.model.grid.get_distance(p, self.target_robot.pos) for p in pos] if len(pos) > 0 else None
                             if distances is not None:
                                 all_closest_pos = [p for p in pos if self.model.grid.get_distance(p, self.target_robot.pos) == min(distances)]
-                                pos = random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
+                                pos = self.random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
                             else:
                                 pos = knowledge["pos"]
                             return {"action": "move", "pos": pos, "objective": f"regroup with {self.target_robot.get_name()}", "target": self.target_robot.pos}
@@ -218,23 +294,11 @@ class CommunicatingRobot(CommunicatingAgent):
                                 self.confirmed = False
                                 return {"action": "move", "pos": self.idle(), "objective": "wait because the target robot has no waste", "target": None}
 
-            closest_waste = min(wastes, key=lambda w: self.model.grid.get_distance(self.pos, w.pos))
             if closest_waste.pos != knowledge["pos"]:
                 action = "move"
                 # move one cell towards the closest waste
-                pos = self.get_accessible_pos(knowledge)
-                distances = [self.model.grid.get_distance(p, closest_waste.pos) for p in pos] if len(pos) > 0 else None
-                if distances is not None:
-                    all_closest_pos = [p for p in pos if self.model.grid.get_distance(p, closest_waste.pos) == min(distances)]
-                    pos = random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
-                else:
-                    pos = knowledge["pos"]
-                for r in knowledge["robots"][knowledge["color"]]:
-                    last_message_perf = self.messages_sent[-1].get_performative() if len(self.messages_sent) > 0 else None
-                    if last_message_perf != MessagePerformative.INFORM_REF:
-                        if r != self:
-                            self.send_message(Message(self.get_name(), r.get_name(), MessagePerformative.INFORM_REF, closest_waste))
-                            self.messages_sent.append(Message(self.get_name(), r.get_name(), MessagePerformative.INFORM_REF, closest_waste))
+                pos = self.move_towards(knowledge, closest_waste.pos)
+                self.claim_waste(knowledge, closest_waste)
                 # print(f"{self.get_name()} broadcasted the fact that he is going to pick up the closest waste which is in {closest_waste.pos}") 
                 return {"action": action, "pos": pos, "objective": f"pick up the closest waste which is in {closest_waste.pos}", "target": closest_waste}
             else:
@@ -273,6 +337,7 @@ class YellowRobot(Robot):
 
         self.knowledge = {
             "wastes": self.model.grid.get_wastes(),
+            "waste_index": self.model.grid.get_waste_indexes(),
             "robots": self.model.grid.get_robots(),
             "inventory": [],
             "pos": self.pos,
@@ -309,6 +374,7 @@ class RedRobot(Robot):
 
         self.knowledge = {
             "wastes": self.model.grid.get_wastes(),
+            "waste_index": self.model.grid.get_waste_indexes(),
             "robots": self.model.grid.get_robots(),
             "inventory": [],
             "pos": self.pos,
@@ -327,22 +393,15 @@ class RedRobot(Robot):
         # red robots pick up red wastes and goest to put them in disposal zone
         if len(self.inventory) < 1:
             self.action = "move"
-            wastes = knowledge["wastes"][knowledge["color"]]
-            if len(wastes) == 0: # No waste of its color, then idle : move to a random cell
+            closest_waste = self.closest_waste(knowledge)
+            if closest_waste is None: # No waste of its color, then idle : move to a random cell
                 pos = self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False)
-                pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                 return {"action": "move", "pos": pos, "objective": "idle"}
-            closest_waste = min(wastes, key=lambda w: self.model.grid.get_distance(self.pos, w.pos))
             if closest_waste.pos != knowledge["pos"]:
                 action = "move"
                 # move one cell towards the closest waste
-                pos = self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False)
-                distances = [self.model.grid.get_distance(p, closest_waste.pos) for p in pos] if len(pos) > 0 else None
-                if distances is not None:
-                    all_closest_pos = [p for p in pos if self.model.grid.get_distance(p, closest_waste.pos) == min(distances)]
-                    pos = random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
-                else:
-                    pos = knowledge["pos"]
+                pos = self.move_towards(knowledge, closest_waste.pos, self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False))
                 return {"action": action, "pos": pos, "objective": f"pick up the closest waste which is in {closest_waste.pos}"}
             else:
                 action = "pick_up"
@@ -351,8 +410,7 @@ class RedRobot(Robot):
             if knowledge["pos"] != knowledge["disposal_zone"]:
                 action = "move"
                 # move one cell towards the disposal zone
-                pos = self.get_accessible_pos(knowledge)
-                pos = min(pos, key=lambda p: self.model.grid.get_distance(p, knowledge["disposal_zone"])) if len(pos) > 0 else knowledge["pos"]
+                pos = self.move_towards(knowledge, knowledge["disposal_zone"])
                 return {"action": action, "pos": pos, "objective": "go to the disposal zone"}
             else:
                 action = "drop"
@@ -370,18 +428,17 @@ class RandomGreenRobot(GreenRobot):
         # if not carrying 2 wastes, move towards (1 cell at a time) the closest waste of its color if not already on it
         if len(self.inventory) < 2:
             self.action = "move"
-            wastes = knowledge["wastes"][knowledge["color"]]
-            if len(wastes) == 0:
+            closest_waste = self.closest_waste(knowledge)
+            if closest_waste is None:
                 action = "move"
                 pos = self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False)
                 pos = [p for p in pos if knowledge["radioactivity"].T[p] <= knowledge["radioactivity_limit"]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["green"]]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["yellow"]]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["red"]]]
-                pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                 return {"action": action, "pos": pos, "objective": "idle"}
             else:
-                closest_waste = min(wastes, key=lambda w: self.model.grid.get_distance(self.pos, w.pos))
                 if closest_waste.pos == knowledge["pos"]:
                     action = "pick_up"
                     return {"action": action, "waste": closest_waste}
@@ -392,7 +449,7 @@ class RandomGreenRobot(GreenRobot):
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["green"]]]
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["yellow"]]]
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["red"]]]
-                    pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                    pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                     return {"action": "move", "pos": pos, "objective": "idle"}
         # if carrying 2 wastes, if not at the border of the zone, move east, else drop a yellow waste
         else:
@@ -422,18 +479,17 @@ class RandomYellowRobot(YellowRobot):
         # if not carrying 2 wastes, move towards (1 cell at a time) the closest waste of its color if not already on it
         if len(self.inventory) < 2:
             self.action = "move"
-            wastes = knowledge["wastes"][knowledge["color"]]
-            if len(wastes) == 0:
+            closest_waste = self.closest_waste(knowledge)
+            if closest_waste is None:
                 action = "move"
                 pos = self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False)
                 pos = [p for p in pos if knowledge["radioactivity"].T[p] <= knowledge["radioactivity_limit"]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["green"]]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["yellow"]]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["red"]]]
-                pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                 return {"action": action, "pos": pos, "objective": "idle"}
             else:
-                closest_waste = min(wastes, key=lambda w: self.model.grid.get_distance(self.pos, w.pos))
                 if closest_waste.pos == knowledge["pos"]:
                     action = "pick_up"
                     return {"action": action, "waste": closest_waste}
@@ -444,7 +500,7 @@ class RandomYellowRobot(YellowRobot):
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["green"]]]
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["yellow"]]]
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["red"]]]
-                    pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                    pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                     return {"action": action, "pos": pos, "objective": "idle"}
         # if carrying 2 wastes, if not at the border of the zone, move east, else drop a yellow waste
         else:
@@ -480,17 +536,16 @@ class RandomRedRobot(RedRobot):
         # red robots pick up red wastes and goest to put them in disposal zone
         if len(self.inventory) < 1:
             self.action = "move"
-            wastes = knowledge["wastes"][knowledge["color"]]
-            if len(wastes) == 0:
+            closest_waste = self.closest_waste(knowledge)
+            if closest_waste is None:
                 action = "move"
                 pos = self.model.grid.get_neighborhood(self.pos, moore = False, include_center = False)
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["green"]]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["yellow"]]]
                 pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["red"]]]
-                pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                 return {"action": action, "pos": pos, "objective": "idle"}
             else:
-                closest_waste = min(wastes, key=lambda w: self.model.grid.get_distance(self.pos, w.pos))
                 if closest_waste.pos == knowledge["pos"]:
                     action = "pick_up"
                     return {"action": action, "waste": closest_waste}
@@ -500,7 +555,7 @@ class RandomRedRobot(RedRobot):
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["green"]]]
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["yellow"]]]
                     pos = [p for p in pos if p not in [r.pos for r in knowledge["robots"]["red"]]]
-                    pos = random.choice(pos) if len(pos) > 0 else knowledge["pos"]
+                    pos = self.random.choice(pos) if len(pos) > 0 else knowledge["pos"]
                     return {"action": action, "pos": pos, "objective": "idle"}
         else:
             if knowledge["pos"] != knowledge["disposal_zone"]:
@@ -517,56 +572,31 @@ class RandomRedRobot(RedRobot):
                 return {"action": action, "waste": self.inventory[0]}
         
 
-class CommunicatingRedRobot(RedRobot, CommunicatingAgent):
+class CommunicatingRedRobot(RedRobot, CommunicatingRobot):
     def __init__(self, unique_id, model, pos):
         RedRobot.__init__(self, unique_id=unique_id, model=model, pos=pos)
-        CommunicatingAgent.__init__(self, unique_id=unique_id, model=model, name=f"RedRobot{unique_id}")
-        self.messages_sent = []
+        CommunicatingRobot.__init__(self, unique_id=unique_id, model=model, name=f"RedRobot{unique_id}")
     
     def deliberate(self, knowledge=None):
         if knowledge is None:
             knowledge = self.knowledge
 
-        # remove all wastes that were broadcasted
-        messages = self.get_messages()
-        for message in messages:
-            if message.get_performative() == MessagePerformative.INFORM_REF:
-                waste = message.get_content()
-                if waste in knowledge["wastes"]["red"]:
-                    knowledge["wastes"]["red"].remove(waste)
-        # print(knowledge["wastes"]["red"])
+        # exclude all wastes that were broadcasted
+        self.update_claimed_wastes(self.get_new_messages())
         
         # red robots pick up red wastes and goest to put them in disposal zone
         if len(self.inventory) < 1:
             self.action = "move"
-            wastes = knowledge["wastes"][knowledge["color"]]
-            if len(wastes) == 0: # No waste of its color, then idle : move to a random cell
-                pos = self.get_accessible_pos(knowledge)
-                distances = [self.model.grid.get_distance(p, (knowledge["left_border"], knowledge["pos"][1])) for p in pos] if len(pos) > 0 else None
-                if distances is not None:
-                    all_closest_pos = [p for p in pos if self.model.grid.get_distance(p, (knowledge["left_border"], knowledge["pos"][1])) == min(distances)]
-                    pos = random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
-                else:
-                    pos = knowledge["pos"]
+            closest_waste = self.closest_waste(knowledge, self.claimed_wastes)
+            if closest_waste is None: # No waste of its color, then idle : move to a random cell
+                pos = self.move_towards(knowledge, (knowledge["left_border"], knowledge["pos"][1]))
                 return {"action": "move", "pos": pos, "objective": "idle", "target": None}
 
-            closest_waste = min(wastes, key=lambda w: self.model.grid.get_distance(self.pos, w.pos))
             if closest_waste.pos != knowledge["pos"]:
                 action = "move"
                 # move one cell towards the closest waste
-                pos = self.get_accessible_pos(knowledge)
-                distances = [self.model.grid.get_distance(p, closest_waste.pos) for p in pos] if len(pos) > 0 else None
-                if distances is not None:
-                    all_closest_pos = [p for p in pos if self.model.grid.get_distance(p, closest_waste.pos) == min(distances)]
-                    pos = random.choice(all_closest_pos) if len(all_closest_pos) > 0 else knowledge["pos"]
-                else:
-                    pos = knowledge["pos"]
-                for r in knowledge["robots"][knowledge["color"]]:
-                    last_message_perf = self.messages_sent[-1].get_performative() if len(self.messages_sent) > 0 else None
-                    if last_message_perf != MessagePerformative.INFORM_REF:
-                        if r != self:
-                            self.send_message(Message(self.get_name(), r.get_name(), MessagePerformative.INFORM_REF, closest_waste))
-                            self.messages_sent.append(Message(self.get_name(), r.get_name(), MessagePerformative.INFORM_REF, closest_waste))
+                pos = self.move_towards(knowledge, closest_waste.pos)
+                self.claim_waste(knowledge, closest_waste)
                 # print(f"{self.get_name()} broadcasted the fact that he is going to pick up the closest waste which is in {closest_waste.pos}") 
                 return {"action": action, "pos": pos, "objective": f"pick up the closest waste which is in {closest_waste.pos}", "target": closest_waste}
             else:
@@ -577,8 +607,7 @@ class CommunicatingRedRobot(RedRobot, CommunicatingAgent):
                 # print(f"{knowledge['pos']} != {knowledge['disposal_zone']}")
                 action = "move"
                 # move one cell towards the disposal zone
-                pos = self.get_accessible_pos(knowledge)
-                pos = min(pos, key=lambda p: self.model.grid.get_distance(p, knowledge["disposal_zone"])) if len(pos) > 0 else knowledge["pos"]
+                pos = self.move_towards(knowledge, knowledge["disposal_zone"])
                 return {"action": action, "pos": pos, "objective": "go to the disposal zone", "target": "disposal"}
             else:
                 action = "drop"
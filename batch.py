@@ -0,0 +1,294 @@
+from mesa import Model
+from mesa.datacollection import DataCollector
+import numpy as np
+from tqdm import trange
+
+from objects import HazardGrid
+
+COLORS = ["green", "yellow", "red"]
+GREEN, YELLOW, RED = 0, 1, 2
+# number of wastes carried before going east, and radioactivity tolerated, by robot color
+CAPACITY = np.array([2, 2, 1])
+RADIOACTIVITY_LIMIT = np.array([1/3, 2/3, 3])
+# states of the wastes
+ON_GRID, CARRIED, CONSUMED = 0, 1, 2
+MOVES = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)])
+
+
+class BatchEnvironnement(Model):
+    """
+    Array version of Environnement (random_policy=False) and RandomEnvironnement (random_policy=True)
+    for the robots without communication.
+    Robots and wastes are rows of NumPy arrays instead of Mesa agents, and all the robots of a color
+    are stepped in one batched pass : target selection, neighbour filtering, moves, pick up and drop.
+
+    The mission rules are the ones of Environnement.do(). As the robots of a color act at the same time,
+    two robots of a color can not move into the same cell nor pick up the same waste : one of them,
+    chosen at random, waits for the next step. Colors act in order green, yellow, red.
+    """
+
+    def __init__(self, Nr, Nw, L, H, random_policy=False, debug=False, seed=None):
+        super().__init__()
+        self.spawn_rate = 0.0
+        self.random_policy = random_policy
+        self.debug = debug
+        self.num_robots = Nr
+        self.num_waste = Nw
+        self.grid_len = L
+        self.grid_height = H
+        self.full_recycled = 0
+        self.steps = 0
+        if seed is not None:
+            self.reset_randomizer(seed)
+        self.np_random = np.random.default_rng(self.random.getrandbits(64))
+
+        # only used for its radioactivity map and zones
+        self.grid = HazardGrid(L, H, 3, self.random, self.np_random)
+        self.radioactivity = self.grid.radioactivity_map.T # indexed by position [x, y]
+        self.disposal_zone = np.array([L - 1, np.argmax(self.grid.radioactivity_map[:, -1])])
+        self.right_borders = np.array([self.grid.zone_widths[0] - 1, sum(self.grid.zone_widths[:2]) - 1, L - 1])
+        self.occupancy = np.zeros((L, H), dtype=np.int64)
+
+        self.waste_pos = np.zeros((0, 2), dtype=np.int64)
+        self.waste_color = np.zeros(0, dtype=np.int64)
+        self.waste_state = np.zeros(0, dtype=np.int64)
+        self.n_wastes = 0
+
+        self.datacollector = DataCollector(
+            model_reporters={"NbWaste": lambda m: m.count_wastes(alive=True),
+                            "FullRecycled": lambda m: m.full_recycled,
+                            "green": lambda m: m.count_wastes(GREEN, alive=True),
+                            "yellow": lambda m: m.count_wastes(YELLOW, alive=True),
+                            "red": lambda m: m.count_wastes(RED, alive=True)}
+        )
+
+        self.spawn_agents()
+
+    def random_positions(self, n, zone):
+        x = self.np_random.integers(zone*self.grid_len//3, (zone+1)*self.grid_len//3, n)
+        y = self.np_random.integers(0, self.grid_height, n)
+        return np.stack([x, y], axis=1)
+
+    def spawn_agents(self):
+        Nwg, Nwy, Nwr = int(self.num_waste*0.7), int(self.num_waste*0.2), int(self.num_waste*0.1)
+        for color, n in zip((GREEN, YELLOW, RED), (Nwg, Nwy, Nwr)):
+            # each color of waste is put in its own zone
+            self.add_wastes(self.random_positions(n, color), color)
+
+        self.robot_pos = np.concatenate([self.random_positions(n, color) for color, n in enumerate(self.num_robots)])
+        self.robot_color = np.repeat(np.arange(3), self.num_robots)
+        # indices of the carried wastes, -1 for an empty slot
+        self.robot_inventory = np.full((len(self.robot_pos), 2), -1, dtype=np.int64)
+        self.robot_carry = np.zeros(len(self.robot_pos), dtype=np.int64)
+        np.add.at(self.occupancy, (self.robot_pos[:, 0], self.robot_pos[:, 1]), 1)
+
+    def add_wastes(self, pos, color):
+        """
+        Put new wastes of the given color on the grid, the arrays grow by doubling
+        """
+        n = len(pos)
+        if self.n_wastes + n > len(self.waste_state):
+            capacity = max(2*len(self.waste_state), self.n_wastes + n)
+            self.waste_pos = np.resize(self.waste_pos, (capacity, 2))
+            self.waste_color = np.resize(self.waste_color, capacity)
+            self.waste_state = np.resize(self.waste_state, capacity)
+        self.waste_pos[self.n_wastes:self.n_wastes+n] = pos
+        self.waste_color[self.n_wastes:self.n_wastes+n] = color
+        self.waste_state[self.n_wastes:self.n_wastes+n] = ON_GRID
+        self.n_wastes += n
+
+    def count_wastes(self, color=None, alive=False):
+        """
+        Count the wastes on the grid, or the wastes not yet consumed (on the grid or carried) if alive
+        """
+        state = self.waste_state[:self.n_wastes]
+        mask = state != CONSUMED if alive else state == ON_GRID
+        if color is not None:
+            mask &= self.waste_color[:self.n_wastes] == color
+        return int(mask.sum())
+
+    def nearest_wastes(self, pos, color):
+        """
+        Get for each position the index of the closest waste of the given color on the grid
+        (-1 if there is none) and its Manhattan distance. Ties go to the oldest waste
+        The nearest waste of every cell is given by a distance transform of the grid, computed
+        once for all the robots of the color
+        """
+        nearest = np.full(len(pos), -1, dtype=np.int64)
+        distance = np.full(len(pos), -1, dtype=np.int64)
+        wastes = np.flatnonzero((self.waste_state[:self.n_wastes] == ON_GRID) & (self.waste_color[:self.n_wastes] == color))
+        if len(wastes) == 0 or len(pos) == 0:
+            return nearest, distance
+        # (distance, waste index) pairs are encoded as distance*m + index so that a min compares both
+        m = self.n_wastes + 1
+        far = self.grid_len + self.grid_height
+        keys = np.full((self.grid_len, self.grid_height), far*m, dtype=np.int64)
+        np.minimum.at(keys, (self.waste_pos[wastes, 0], self.waste_pos[wastes, 1]), wastes)
+        # the Manhattan distance transform is separable : along x, then along y
+        keys = self.distance_transform(keys, m, axis=0)
+        keys = self.distance_transform(keys, m, axis=1)
+        cell_keys = keys[pos[:, 0], pos[:, 1]]
+        found = cell_keys // m < far
+        nearest[found] = cell_keys[found] % m
+        distance[found] = cell_keys[found] // m
+        return nearest, distance
+
+    @staticmethod
+    def distance_transform(keys, m, axis):
+        """
+        1D Manhattan distance transform of encoded (distance, index) keys along one axis :
+        min over j of d[j] + |i - j|, written as two cumulative minima
+        """
+        shape = [1, 1]
+        shape[axis] = keys.shape[axis]
+        i = np.arange(keys.shape[axis]).reshape(shape)
+        d, index = keys // m, keys % m
+        forward = np.minimum.accumulate((d - i)*m + index, axis=axis)
+        forward = (forward // m + i)*m + forward % m
+        backward = np.flip(np.minimum.accumulate(np.flip((d + i)*m + index, axis=axis), axis=axis), axis=axis)
+        backward = (backward // m - i)*m + backward % m
+        return np.minimum(forward, backward)
+
+    def neighbours(self, pos, color, avoid_robots=True, limit=True):
+        """
+        Get the 4 neighbour cells of each position, and a mask of the ones the robot can go to
+        """
+        cells = pos[:, None, :] + MOVES[None, :, :]
+        valid = (cells[..., 0] >= 0) & (cells[..., 0] < self.grid_len) & (cells[..., 1] >= 0) & (cells[..., 1] < self.grid_height)
+        x = np.clip(cells[..., 0], 0, self.grid_len - 1)
+        y = np.clip(cells[..., 1], 0, self.grid_height - 1)
+        if limit:
+            valid &= self.radioactivity[x, y] <= RADIOACTIVITY_LIMIT[color]
+        if avoid_robots:
+            valid &= self.occupancy[x, y] == 0
+        return cells, valid
+
+    def choose(self, pos, cells, valid, target=None):
+        """
+        Choose for each robot the valid neighbour closest to its target (ties at random),
+        or a random valid neighbour if there is no target. Robots without valid neighbour stay
+        """
+        if len(pos) == 0:
+            return pos
+        score = self.np_random.random(valid.shape)
+        if target is not None:
+            score = np.abs(cells - target[:, None, :]).sum(axis=2) + 0.5*score
+        score = np.where(valid, score, np.inf)
+        chosen = cells[np.arange(len(cells)), score.argmin(axis=1)]
+        stuck = ~valid.any(axis=1)
+        chosen[stuck] = pos[stuck]
+        return chosen
+
+    def step_color(self, color):
+        """
+        Step all the robots of one color
+        """
+        robots = np.flatnonzero(self.robot_color == color)
+        if len(robots) == 0:
+            return
+        pos = self.robot_pos[robots]
+        new_pos = pos.copy()
+        # moves that must not end on a robot, resolved together at the end
+        avoiding = np.zeros(len(robots), dtype=bool)
+        full = self.robot_carry[robots] >= CAPACITY[color]
+        is_red = color == RED
+
+        # robots looking for a waste
+        seek = np.flatnonzero(~full)
+        nearest, distance = self.nearest_wastes(pos[seek], color)
+        idle = seek[nearest == -1]
+        pick = seek[distance == 0]
+        go = seek[distance > 0]
+        target = self.waste_pos[nearest[distance > 0]]
+
+        # no waste of its color : move to a random cell
+        cells, valid = self.neighbours(pos[idle], color, avoid_robots=not (is_red and not self.random_policy), limit=not is_red)
+        new_pos[idle] = self.choose(pos[idle], cells, valid)
+        avoiding[idle] = not (is_red and not self.random_policy)
+
+        # move one cell towards the closest waste (or at random for the random policy)
+        if is_red and not self.random_policy:
+            cells, valid = self.neighbours(pos[go], color, avoid_robots=False, limit=False)
+        else:
+            cells, valid = self.neighbours(pos[go], color, limit=not is_red)
+        new_pos[go] = self.choose(pos[go], cells, valid, None if self.random_policy else target)
+        avoiding[go] = self.random_policy or not is_red
+
+        # pick up the waste, a waste picked by several robots goes to one of them
+        if len(pick) > 0:
+            wastes = nearest[distance == 0]
+            order = self.np_random.permutation(len(pick))
+            _, first = np.unique(wastes[order], return_index=True)
+            winners, wastes = robots[pick[order[first]]], wastes[order[first]]
+            self.waste_state[wastes] = CARRIED
+            self.robot_inventory[winners, self.robot_carry[winners]] = wastes
+            self.robot_carry[winners] += 1
+
+        # robots at full capacity
+        loaded = np.flatnonzero(full)
+        if is_red:
+            at_disposal = (pos[loaded] == self.disposal_zone).all(axis=1)
+            drop, go = loaded[at_disposal], loaded[~at_disposal]
+            cells, valid = self.neighbours(pos[go], color, limit=False)
+            new_pos[go] = self.choose(pos[go], cells, valid, np.broadcast_to(self.disposal_zone, (len(go), 2)))
+            avoiding[go] = True
+        else:
+            at_border = pos[loaded, 0] >= self.right_borders[color]
+            drop, go = loaded[at_border], loaded[~at_border]
+            new_pos[go, 0] += 1
+
+        # drop : transform the wastes carried into one of the upper color, or put them away
+        if len(drop) > 0:
+            dropping = robots[drop]
+            carried = self.robot_inventory[dropping]
+            self.waste_state[carried[carried >= 0]] = CONSUMED
+            self.robot_inventory[dropping] = -1
+            self.robot_carry[dropping] = 0
+            if is_red:
+                self.full_recycled += len(dropping)
+            else:
+                self.add_wastes(pos[drop], color + 1)
+
+        # two robots can not move into the same free cell : one at random moves, the others wait
+        movers = np.flatnonzero(avoiding & (new_pos != pos).any(axis=1))
+        if len(movers) > 0:
+            order = self.np_random.permutation(movers)
+            cell_ids = new_pos[order, 0]*self.grid_height + new_pos[order, 1]
+            _, first = np.unique(cell_ids, return_index=True)
+            losers = np.setdiff1d(order, order[first])
+            new_pos[losers] = pos[losers]
+
+        np.add.at(self.occupancy, (pos[:, 0], pos[:, 1]), -1)
+        np.add.at(self.occupancy, (new_pos[:, 0], new_pos[:, 1]), 1)
+        self.robot_pos[robots] = new_pos
+
+    def spawn(self, spawn_rate):
+        if self.np_random.random() < spawn_rate:
+            pos = self.random_positions(1, GREEN)
+            self.add_wastes(pos, GREEN)
+            if self.debug:
+                print("New waste spawned at", tuple(pos[0]))
+
+    def one_step(self):
+        self.datacollector.collect(self)
+        for color in (GREEN, YELLOW, RED):
+            self.step_color(color)
+        self.steps += 1
+        self.spawn(self.spawn_rate)
+
+    def run_n_steps(self, n):
+        for i in trange(n):
+            self.one_step()
+
+    def terminated(self):
+        if self.count_wastes() > 0:
+            return False
+        # green or yellow robots with 2 wastes, or red robots with 1 waste still have something to do
+        return not (self.robot_carry >= CAPACITY[self.robot_color]).any()
+
+    def run_while(self, max_steps=None):
+        while not self.terminated() and (max_steps is None or self.steps < max_steps):
+            self.one_step()
+            if (self.steps % 10 == 0 or self.terminated()) and self.debug:
+                print(f"\033[1;32;40mWastes remaining : {self.count_wastes(alive=True)} : \n\t {[int(self.robot_carry[self.robot_color == color].sum()) for color in (GREEN, YELLOW, RED)]} carried by green, yellow, red robots\033[0m")
+        self.datacollector.collect(self)
@@ -19,20 +19,34 @@ class CommunicatingAgent(Agent):
         message_service: The message service used to send and receive message (MessageService)
     """
 
-    def __init__(self, unique_id, model, name):
+    def __init__(self, unique_id, model, name, max_size=None, ttl=None, drop_after_consume=False, message_service=None):
         """ Create a new communicating agent.
+        max_size, ttl (in steps of the model's scheduler) and drop_after_consume set the retention of the mailbox.
+        The message service is the one given, else the model's message_service, else MessageService.get_instance().
         """
         super().__init__(unique_id, model)
         # print(f"creating CommunicatingAgent with name: {name}")
         self.__name = name
-        self.__mailbox = Mailbox()
-        self.__messages_service = MessageService.get_instance()
+        clock = (lambda: model.schedule.steps) if ttl is not None else None
+        self.__mailbox = Mailbox(max_size, ttl, drop_after_consume, clock)
+        if message_service is None:
+            message_service = getattr(model, "message_service", None)
+        if message_service is None:
+            message_service = MessageService.get_instance()
+        self.__messages_service = message_service
+        self.__messages_service.register_agent(self)
 
     def step(self):
         """ The step methods of the agent called by the scheduler at each time tick.
         """
         super().step()
 
+    def remove(self):
+        """ Remove the agent from the model, it no longer receives messages.
+        """
+        self.__messages_service.unregister_agent(self)
+        super().remove()
+
     def get_name(self):
         """ Return the name of the communicating agent."""
         return self.__name
@@ -42,27 +56,49 @@ class CommunicatingAgent(Agent):
         """
         self.__mailbox.receive_messages(message)
 
+    def receive_messages(self, messages):
+        """ Receive several messages at once (called by the MessageService object) and store them in the mailbox.
+        """
+        self.__mailbox.receive_messages_batch(messages)
+
     def send_message(self, message):
         """ Send message through the MessageService object.
+        Return the number of recipients : 0 if the message service dropped it as a duplicate.
+        """
+        return self.__messages_service.send_message(message)
+
+    def subscribe(self, topic):
+        """ Subscribe to a topic of the MessageService object.
+        """
+        self.__messages_service.subscribe(self, topic)
+
+    def broadcast_message(self, message, topic, exclude=()):
+        """ Broadcast message to the other subscribers of the topic, except the agents in exclude.
+        Return the number of recipients : 0 if the message service dropped it as a duplicate.
         """
-        self.__messages_service.send_message(message)
+        return self.__messages_service.broadcast_message(message, topic, (self, *exclude))
 
     def get_new_messages(self):
         """ Return all the unread messages.
         """
         return self.__mailbox.get_new_messages()
 
+    def get_messages_since(self, cursor):
+        """ Return the messages received since the cursor, and the cursor to use for the next call.
+        """
+        return self.__mailbox.get_messages_since(cursor)
+
     def get_messages(self):
         """ Return all the received messages.
         """
         return self.__mailbox.get_messages()
 
     def get_messages_from_performative(self, performative):
-        """ Return a list of messages which have the same performative.
+        """ Return a read-only view of the messages which have the same performative.
         """
         return self.__mailbox.get_messages_from_performative(performative)
 
     def get_messages_from_exp(self, exp):
-        """ Return a list of messages which have the same sender.
+        """ Return a read-only view of the messages which have the same sender.
         """
         return self.__mailbox.get_messages_from_exp(exp)
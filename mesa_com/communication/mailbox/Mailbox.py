@@ -1,58 +1,139 @@
 #!/usr/bin/env python3
 
+from collections import deque
+from collections.abc import Sequence
+
+
+class MessagesView(Sequence):
+    """MessagesView class.
+    Read-only view of messages kept by a Mailbox, oldest first. It is not a copy :
+    it follows the messages received and dropped by the mailbox.
+    """
+
+    def __init__(self, messages):
+        self.__messages = messages
+
+    def __len__(self):
+        return len(self.__messages)
+
+    def __getitem__(self, index):
+        return self.__messages[index]
+
+    def __iter__(self):
+        return iter(self.__messages)
+
+    def __repr__(self):
+        return repr(list(self.__messages))
+
 
 class Mailbox:
     """Mailbox class.
     Class implementing the mailbox object which manages messages in communicating agents.
 
+    Each message received gets a sequence number. The messages whose number is lower than
+    the read cursor are read, the others are unread.
+
     attr:
-        unread_messages: The list of unread messages
-        read_messages: The list of read messages
+        messages: The retained messages, oldest first, as (sequence number, reception time, message)
+        next_seq: The sequence number of the next message received
+        read_cursor: The sequence number of the first unread message
+        max_size: The maximum number of messages retained, the oldest ones are dropped first (None: no limit)
+        ttl: The number of time steps a message is retained (None: no limit)
+        drop_after_consume: If True, read messages are dropped
+        clock: Function returning the current time step, required by ttl
+        by_performative: The retained messages indexed by performative
+        by_exp: The retained messages indexed by sender
      """
 
-    def __init__(self):
+    def __init__(self, max_size=None, ttl=None, drop_after_consume=False, clock=None):
         """ Create a new Mailbox.
         """
-        self.__unread_messages = []
-        self.__read_messages = []
+        if ttl is not None and clock is None:
+            raise ValueError("A clock is required to expire messages after a ttl")
+        self.__messages = deque()
+        self.__next_seq = 0
+        self.__read_cursor = 0
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__drop_after_consume = drop_after_consume
+        self.__clock = clock
+        self.__by_performative = {}
+        self.__by_exp = {}
+
+    def __pop_oldest(self):
+        """ Drop the oldest message, which is also the oldest one of its indexes.
+        """
+        _, _, message = self.__messages.popleft()
+        self.__by_performative[message.get_performative()].popleft()
+        self.__by_exp[message.get_exp()].popleft()
+
+    def __evict(self):
+        """ Drop the messages which are no longer retained.
+        """
+        if self.__max_size is not None:
+            while len(self.__messages) > self.__max_size:
+                self.__pop_oldest()
+        if self.__ttl is not None:
+            now = self.__clock()
+            while len(self.__messages) > 0 and now - self.__messages[0][1] >= self.__ttl:
+                self.__pop_oldest()
+        if self.__drop_after_consume:
+            while len(self.__messages) > 0 and self.__messages[0][0] < self.__read_cursor:
+                self.__pop_oldest()
 
     def receive_messages(self, message):
         """ Receive a message and add it in the unread messages list.
         """
-        self.__unread_messages.append(message)
+        self.receive_messages_batch((message,))
+
+    def receive_messages_batch(self, messages):
+        """ Receive several messages and add them in the unread messages list.
+        """
+        time = self.__clock() if self.__clock is not None else None
+        for message in messages:
+            self.__messages.append((self.__next_seq, time, message))
+            self.__by_performative.setdefault(message.get_performative(), deque()).append(message)
+            self.__by_exp.setdefault(message.get_exp(), deque()).append(message)
+            self.__next_seq += 1
+        self.__evict()
 
     def get_new_messages(self):
         """ Return all the messages from unread messages list.
         """
-        unread_messages = self.__unread_messages.copy()
-        if len(unread_messages) > 0:
-            for messages in unread_messages:
-                self.__read_messages.append(messages)
-
-        self.__unread_messages.clear()
+        unread_messages, self.__read_cursor = self.get_messages_since(self.__read_cursor)
+        self.__evict()
         return unread_messages
 
+    def get_messages_since(self, cursor):
+        """ Return the retained messages received since the cursor, and the cursor to use for the next call.
+        A cursor is a sequence number : 0 to get all the retained messages.
+        """
+        self.__evict()
+        # sequence numbers are increasing : only the end of the mailbox is visited
+        messages = []
+        for seq, _, message in reversed(self.__messages):
+            if seq < cursor:
+                break
+            messages.append(message)
+        messages.reverse()
+        return messages, self.__next_seq
+
     def get_messages(self):
         """ Return all the messages from both unread and read messages list.
         """
-        if len(self.__unread_messages) > 0:
-            self.get_new_messages()
-        return self.__read_messages
+        unread_messages = self.get_new_messages() if self.__read_cursor < self.__next_seq else []
+        if self.__drop_after_consume:
+            return unread_messages
+        return [message for _, _, message in self.__messages]
 
     def get_messages_from_performative(self, performative):
-        """ Return a list of messages which have the same performative.
+        """ Return a read-only view of the messages which have the same performative.
         """
-        messages_from_performative = []
-        for message in self.__unread_messages + self.__read_messages:
-            if message.get_performative() == performative:
-                messages_from_performative.append(message)
-        return messages_from_performative
+        self.__evict()
+        return MessagesView(self.__by_performative.setdefault(performative, deque()))
 
     def get_messages_from_exp(self, exp):
-        """ Return a list of messages which have the same sender.
+        """ Return a read-only view of the messages which have the same sender.
         """
-        messages_from_exp = []
-        for message in self.__unread_messages + self.__read_messages:
-            if message.get_exp() == exp:
-                messages_from_exp.append(message)
-        return messages_from_exp
+        self.__evict()
+        return MessagesView(self.__by_exp.setdefault(exp, deque()))
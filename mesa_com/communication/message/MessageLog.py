@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+class MessageLog:
+    """MessageLog class.
+    Class implementing a compact log of the messages delivered by a message service,
+    one row per recipient, stored in NumPy arrays grown by doubling.
+
+    attr:
+        columns: the arrays of the log : step, sender, recipient, performative, content (dict)
+        size: the number of rows recorded (int)
+    """
+
+    COLUMNS = {"step": np.int64, "sender": np.int64, "recipient": np.int64, "performative": np.int16, "content": np.int64}
+
+    def __init__(self, capacity=1024):
+        """ Create a new empty MessageLog.
+        """
+        self.__columns = {name: np.empty(capacity, dtype) for name, dtype in MessageLog.COLUMNS.items()}
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def record(self, step, sender, recipients, performative, content):
+        """ Record a message sent at step to each of the recipients.
+        sender, recipients and content are ids (-1 if unknown), performative is a MessagePerformative.
+        """
+        n = len(recipients)
+        end = self.__size + n
+        capacity = len(self.__columns["step"])
+        if end > capacity:
+            capacity = max(2 * capacity, end)
+            for name, column in self.__columns.items():
+                grown = np.empty(capacity, column.dtype)
+                grown[:self.__size] = column[:self.__size]
+                self.__columns[name] = grown
+        self.__columns["step"][self.__size:end] = step
+        self.__columns["sender"][self.__size:end] = sender
+        self.__columns["recipient"][self.__size:end] = recipients
+        self.__columns["performative"][self.__size:end] = performative.value
+        self.__columns["content"][self.__size:end] = content
+        self.__size = end
+
+    def get_columns(self):
+        """ Return the recorded rows, one read-only array per column.
+        """
+        columns = {}
+        for name, column in self.__columns.items():
+            view = column[:self.__size]
+            view.flags.writeable = False
+            columns[name] = view
+        return columns
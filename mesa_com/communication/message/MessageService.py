@@ -1,65 +1,221 @@
 #!/usr/bin/env python3
 
+from collections import Counter, deque
+
+from .MessagePerformative import MessagePerformative
+
+
 class MessageService:
     """MessageService class.
     Class implementing the message service used to dispatch messages between communicating agents.
 
-    Not intended to be created more than once: it's a singleton.
+    Each model owns its message service and gives it to its communicating agents. The last service
+    created is also available through get_instance(), for the agents created without one.
 
     attr:
         scheduler: the scheduler of the sma (Scheduler)
-        messages_to_proceed: the list of message to proceed mailbox of the agent (list)
+        latency: number of steps before a message is delivered, when instant delivery is off (int)
+        queues: the messages to deliver, as (step, {recipient: [messages]}) queues in delivery order (deque)
+        agents: the communicating agents registered by name (dict)
+        topics: the subscribers of each topic, by name (dict)
+        coalescing_window: number of steps during which a message identical to one already sent
+            (same sender, recipient, performative and content) is dropped : 0 to disable, None for ever (int)
+        coalesced_performatives: the performatives concerned by the coalescing (tuple)
+        last_sent: the step at which each (sender, recipient, performative, content) was last sent (dict),
+            the messages whose content is suppressed (a consumed waste) are forgotten
+        suppressed: the number of messages dropped by the coalescing, by performative (Counter)
+        message_log: if given, every message sent is recorded in it, once per recipient (MessageLog)
     """
 
     __instance = None
 
     @staticmethod
     def get_instance():
-        """ Static access method.
+        """ Static access method, return the last message service created.
         """
         return MessageService.__instance
 
-    def __init__(self, scheduler, instant_delivery=True):
+    def __init__(self, scheduler, instant_delivery=True, coalescing_window=0,
+                 coalesced_performatives=(MessagePerformative.INFORM_REF,), message_log=None, latency=0):
         """ Create a new MessageService object.
         """
-        if MessageService.__instance is not None:
-            raise Exception("This class is a singleton!")
-        else:
-            MessageService.__instance = self
-            self.__scheduler = scheduler
-            self.__instant_delivery = instant_delivery
-            self.__messages_to_proceed = []
+        MessageService.__instance = self
+        self.__scheduler = scheduler
+        self.__instant_delivery = instant_delivery
+        self.__latency = latency
+        self.__queues = deque()
+        self.__agents = {}
+        self.__topics = {}
+        self.__coalescing_window = coalescing_window
+        self.__coalesced_performatives = coalesced_performatives
+        self.__last_sent = {}
+        self.__last_pruning = 0
+        self.__pruned_size = 0
+        self.__suppressed = Counter()
+        self.__message_log = message_log
+
+    def get_message_log(self):
+        """ Return the log of the messages sent, None if they are not logged.
+        """
+        return self.__message_log
+
+    def log_message(self, message, recipients):
+        """ Record the message in the message log, the ids of the recipients are given.
+        """
+        sender = self.__agents.get(message.get_exp())
+        self.__message_log.record(self.__scheduler.steps, sender.unique_id if sender is not None else -1,
+                                  recipients, message.get_performative(), getattr(message.get_content(), "unique_id", -1))
+
+    def register_agent(self, agent):
+        """ Register an agent so that messages can be dispatched to it by name.
+        """
+        self.__agents[agent.get_name()] = agent
+
+    def unregister_agent(self, agent):
+        """ Unregister an agent, messages can no longer be dispatched to it.
+        """
+        self.__agents.pop(agent.get_name(), None)
+        for subscribers in self.__topics.values():
+            subscribers.pop(agent.get_name(), None)
+
+    def subscribe(self, agent, topic):
+        """ Subscribe an agent to a topic, it will receive the messages broadcasted on it.
+        """
+        self.__topics.setdefault(topic, {})[agent.get_name()] = agent
+
+    def unsubscribe(self, agent, topic):
+        """ Unsubscribe an agent from a topic.
+        """
+        self.__topics.get(topic, {}).pop(agent.get_name(), None)
+
+    def get_subscribers(self, topic):
+        """ Return the agents subscribed to a topic.
+        """
+        return list(self.__topics.get(topic, {}).values())
 
     def set_instant_delivery(self, instant_delivery):
         """ Set the instant delivery parameter.
         """
         self.__instant_delivery = instant_delivery
 
+    def set_latency(self, latency):
+        """ Set the number of steps before a message is delivered, when instant delivery is off.
+        The messages already queued keep their delivery step.
+        """
+        self.__latency = latency
+
+    def enqueue(self, message, recipients):
+        """ Add the message to the queue of the step at which it must be delivered, grouped by recipient.
+        """
+        step = self.__scheduler.steps + self.__latency
+        # the queues stay sorted by step : after the latency is lowered, a message can go before the last ones
+        index = len(self.__queues)
+        while index > 0 and self.__queues[index - 1][0] > step:
+            index -= 1
+        if index > 0 and self.__queues[index - 1][0] == step:
+            queue = self.__queues[index - 1][1]
+        else:
+            queue = {}
+            self.__queues.insert(index, (step, queue))
+        for agent in recipients:
+            queue.setdefault(agent, []).append(message)
+
+    def coalesce(self, message):
+        """ Return True if an identical message was sent within the coalescing window : the message is then dropped.
+        """
+        if self.__coalescing_window == 0 or message.get_performative() not in self.__coalesced_performatives:
+            return False
+        key = (message.get_exp(), message.get_dest(), message.get_performative(), message.get_content())
+        step = self.__scheduler.steps
+        last_step = self.__last_sent.get(key)
+        if last_step is not None and (self.__coalescing_window is None or step - last_step < self.__coalescing_window):
+            self.__suppressed[message.get_performative()] += 1
+            return True
+        self.__last_sent[key] = step
+        return False
+
+    def get_coalescing_size(self):
+        """ Return the number of messages remembered by the coalescing.
+        """
+        return len(self.__last_sent)
+
+    def get_suppressed_count(self, performative=None):
+        """ Return the number of messages dropped by the coalescing, for one performative or in total.
+        """
+        if performative is None:
+            return sum(self.__suppressed.values())
+        return self.__suppressed[performative]
+
     def send_message(self, message):
         """ Dispatch message if instant delivery active, otherwise add the message to proceed list.
+        Return the number of recipients : 0 if the message was coalesced with a previous one.
         """
+        if self.coalesce(message):
+            return 0
+        if self.__message_log is not None:
+            recipient = self.__agents.get(message.get_dest())
+            self.log_message(message, [recipient.unique_id if recipient is not None else -1])
         if self.__instant_delivery:
             self.dispatch_message(message)
         else:
-            self.__messages_to_proceed.append(message)
+            self.enqueue(message, [self.find_agent_from_name(message.get_dest())])
+        return 1
 
-    def dispatch_message(self, message):
-        """ Dispatch the message to the right agent.
+    def broadcast_message(self, message, topic, exclude=()):
+        """ Send the same message object to every subscriber of the topic, except the agents in exclude.
+        Return the number of recipients : 0 if the message was coalesced with a previous one.
         """
-        self.find_agent_from_name(message.get_dest()).receive_message(message)
+        if self.coalesce(message):
+            return 0
+        recipients = [agent for agent in self.__topics.get(topic, {}).values() if agent not in exclude]
+        if self.__message_log is not None:
+            self.log_message(message, [agent.unique_id for agent in recipients])
+        if self.__instant_delivery:
+            self.dispatch_message(message, recipients)
+        else:
+            self.enqueue(message, recipients)
+        return len(recipients)
+
+    def dispatch_message(self, message, recipients=None):
+        """ Dispatch the message to the right agent, or to each of the recipients given.
+        """
+        if recipients is None:
+            self.find_agent_from_name(message.get_dest()).receive_message(message)
+        else:
+            for agent in recipients:
+                agent.receive_message(message)
 
     def dispatch_messages(self):
-        """ Proceed each message received by the message service.
+        """ Deliver the messages whose delivery step is reached, each recipient receives its messages at once.
         """
-        if len(self.__messages_to_proceed) > 0:
-            for message in self.__messages_to_proceed:
-                self.dispatch_message(message)
+        step = self.__scheduler.steps
+        while len(self.__queues) > 0 and self.__queues[0][0] <= step:
+            _, queue = self.__queues.popleft()
+            for agent, messages in queue.items():
+                agent.receive_messages(messages)
+        self.prune_coalescing()
 
-        self.__messages_to_proceed.clear()
+    def prune_coalescing(self):
+        """ Forget the messages sent before the coalescing window, and the ones whose content is suppressed.
+        Without a window, the messages are only pruned once their number has doubled since the last pruning.
+        """
+        window = self.__coalescing_window
+        step = self.__scheduler.steps
+        if window is None:
+            if len(self.__last_sent) >= max(2 * self.__pruned_size, 64):
+                self.__last_sent = {key: last_step for key, last_step in self.__last_sent.items()
+                                    if not getattr(key[3], "suppressed", False)}
+                self.__pruned_size = len(self.__last_sent)
+        elif window > 0 and step - self.__last_pruning >= window:
+            self.__last_sent = {key: last_step for key, last_step in self.__last_sent.items()
+                                if step - last_step < window and not getattr(key[3], "suppressed", False)}
+            self.__last_pruning = step
 
     def find_agent_from_name(self, agent_name):
         """ Return the agent according to the agent name given.
+        Raise a KeyError if no agent is registered with this name.
         """
-        for agent in self.__scheduler.agents:
-            if agent.get_name() == agent_name:
-                return agent
+        try:
+            return self.__agents[agent_name]
+        except KeyError:
+            raise KeyError(f"No communicating agent named {agent_name!r} is registered to the message service") from None
@@ -1,3 +1,4 @@
 from .Message import *
+from .MessageLog import *
 from .MessagePerformative import *
 from .MessageService import *
\ No newline at end of file
@@ -3,12 +3,13 @@
 Testing all the functionalities of the communication package.
 """
 
-from mesa_com import Model
+from mesa import Model
 from mesa.time import RandomActivation
 
 from communication.agent.CommunicatingAgent import CommunicatingAgent
 from communication.mailbox.Mailbox import Mailbox
 from communication.message.Message import Message
+from communication.message.MessageLog import MessageLog
 from communication.message.MessagePerformative import MessagePerformative
 from communication.message.MessageService import MessageService
 
@@ -67,6 +68,41 @@ if __name__ == "__main__":
     assert(len(mailbox.get_messages_from_performative(MessagePerformative.ARGUE)) == 1)
     print("*     get_messages_from_performative() => OK")
 
+    messages, cursor = mailbox.get_messages_since(0)
+    assert(len(messages) == 3 and cursor == 3)
+    mailbox.receive_messages(m1)
+    messages, cursor = mailbox.get_messages_since(cursor)
+    assert(messages == [m1] and cursor == 4)
+    print("*     get_messages_since() => OK")
+
+    bounded_mailbox = Mailbox(max_size=2)
+    for m in (m1, m2, m3):
+        bounded_mailbox.receive_messages(m)
+    assert(bounded_mailbox.get_messages() == [m2, m3])
+    assert(list(bounded_mailbox.get_messages_from_exp("Agent1")) == [m2])
+    assert(len(bounded_mailbox.get_messages_from_performative(MessagePerformative.PROPOSE)) == 0)
+    time = [0]
+    expiring_mailbox = Mailbox(ttl=2, clock=lambda: time[0])
+    expiring_mailbox.receive_messages(m1)
+    time[0] = 1
+    expiring_mailbox.receive_messages(m2)
+    time[0] = 2
+    assert(expiring_mailbox.get_messages() == [m2])
+    consuming_mailbox = Mailbox(drop_after_consume=True)
+    consuming_mailbox.receive_messages(m1)
+    assert(consuming_mailbox.get_new_messages() == [m1])
+    assert(len(consuming_mailbox.get_messages()) == 0)
+    print("*     max_size, ttl & drop_after_consume => OK")
+
+    log = MessageLog(capacity=1)
+    log.record(0, 1, [2, 3], MessagePerformative.INFORM_REF, 7)
+    log.record(1, 2, [1], MessagePerformative.ARGUE, -1)
+    columns = log.get_columns()
+    assert(len(log) == 3)
+    assert(list(columns["recipient"]) == [2, 3, 1])
+    assert(list(columns["performative"]) == [107, 107, 105])
+    print("*     MessageLog record() & get_columns() => OK")
+
     print("* 2) Testing CommunicatingAgent & MessageService")
 
     communicating_model = TestModel()
@@ -91,6 +127,13 @@ if __name__ == "__main__":
     assert(len(agent1.get_messages()) == 2)
     print("*     send_message() & dispatch_message (instant delivery) => OK")
 
+    try:
+        agent0.send_message(Message("Agent0", "Agent2", MessagePerformative.COMMIT, "Bonjour"))
+        assert(False)
+    except KeyError:
+        pass
+    print("*     send_message() to an unknown agent => OK")
+
     MessageService.get_instance().set_instant_delivery(False)
 
     agent0.send_message(Message("Agent0", "Agent1", MessagePerformative.COMMIT, "Bonjour"))
@@ -108,3 +151,65 @@ if __name__ == "__main__":
     assert(len(agent1.get_messages()) == 4)
     print("*     send_message() & dispatch_messages => OK")
 
+
+    agent0.subscribe("Topic")
+    agent1.subscribe("Topic")
+    m4 = Message("Agent0", "Topic", MessagePerformative.INFORM_REF, "Bonjour")
+    assert(agent0.broadcast_message(m4, "Topic") == 1)
+    communicating_model.step()
+    assert(agent1.get_new_messages() == [m4])
+    assert(len(agent0.get_new_messages()) == 0)
+    print("*     subscribe() & broadcast_message() => OK")
+
+    other_model = TestModel()
+    agent0.send_message(Message("Agent0", "Agent1", MessagePerformative.COMMIT, "Bonjour"))
+    communicating_model.step()
+    assert(agent1.get_new_messages()[-1].get_dest() == "Agent1")
+    assert(len(other_model.schedule.agents[1].get_messages()) == 0)
+    print("*     two models with their own MessageService => OK")
+
+    other_service = MessageService.get_instance()
+    other_service.set_instant_delivery(False)
+    other_service.set_latency(1)
+    other0 = other_model.schedule.agents[0]
+    other1 = other_model.schedule.agents[1]
+    other0.send_message(Message("Agent0", "Agent1", MessagePerformative.COMMIT, "Bonjour"))
+    other0.send_message(Message("Agent0", "Agent1", MessagePerformative.COMMIT, "Hello"))
+    other_model.step()
+    assert(len(other1.get_messages()) == 0)
+    other_model.step()
+    assert(len(other1.get_messages()) == 2)
+    print("*     set_latency() & dispatch_messages => OK")
+
+    class Claim:
+        """ Content of a claim, which can be consumed like a waste.
+        """
+        def __init__(self):
+            self.suppressed = False
+
+    coalescing_model = TestModel()
+    coalescing_service = MessageService(coalescing_model.schedule, coalescing_window=None)
+    for agent in coalescing_model.schedule.agents:
+        coalescing_service.register_agent(agent)
+    claims = [Claim() for _ in range(100)]
+    for claim in claims:
+        m5 = Message("Agent0", "Agent1", MessagePerformative.INFORM_REF, claim)
+        assert(coalescing_service.send_message(m5) == 1)
+        assert(coalescing_service.send_message(m5) == 0)
+    assert(coalescing_service.get_suppressed_count(MessagePerformative.INFORM_REF) == 100)
+    for claim in claims:
+        claim.suppressed = True
+    coalescing_service.dispatch_messages()
+    assert(coalescing_service.get_coalescing_size() == 0)
+    print("*     coalesce() & pruning of the suppressed contents => OK")
+
+    other_service.set_latency(3)
+    other0.send_message(Message("Agent0", "Agent1", MessagePerformative.COMMIT, "Late"))
+    other_service.set_latency(0)
+    other0.send_message(Message("Agent0", "Agent1", MessagePerformative.COMMIT, "Early"))
+    other_model.step()
+    assert([m.get_content() for m in other1.get_new_messages()] == ["Early"])
+    for _ in range(3):
+        other_model.step()
+    assert([m.get_content() for m in other1.get_new_messages()] == ["Late"])
+    print("*     set_latency() lowered with queued messages => OK")
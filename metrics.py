@@ -0,0 +1,116 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+##########################
+###### Metrics sink ######
+##########################
+
+class StreamingCollector:
+    """
+    Replacement of mesa's DataCollector that streams the metrics to disk instead of keeping them in memory.
+    Collected rows are buffered and written every chunk_size samples, one .npz file per chunk
+    holding one array per column (model_00000.npz, agents_00000.npz, ... in path).
+    Model metrics are sampled every interval steps, agent metrics every agent_interval steps,
+    and only for the agents accepted by agent_filter (by default the ones with an inventory, i.e. the robots)
+    """
+
+    def __init__(self, path, model_reporters=None, agent_reporters=None, interval=1, agent_interval=None,
+                 chunk_size=1000, agent_filter=lambda a: hasattr(a, "inventory")):
+        self.path = path
+        self.model_reporters = model_reporters if model_reporters is not None else {}
+        self.agent_reporters = agent_reporters if agent_reporters is not None else {}
+        self.interval = interval
+        self.agent_interval = agent_interval if agent_interval is not None else interval
+        self.chunk_size = chunk_size
+        self.agent_filter = agent_filter
+        os.makedirs(path, exist_ok=True)
+        for f in glob.glob(os.path.join(path, "model_*.npz")) + glob.glob(os.path.join(path, "agents_*.npz")):
+            os.remove(f)
+        self.model_rows = []
+        self.agent_rows = []
+        self.model_chunks = 0
+        self.agent_chunks = 0
+        self.last_model_step = None
+        self.last_agent_step = None
+
+    @staticmethod
+    def get_step(model):
+        return model.schedule.steps if hasattr(model, "schedule") else model.steps
+
+    def collect(self, model, force=False):
+        """
+        Record the metrics of the model if the current step is sampled (or if force)
+        """
+        step = self.get_step(model)
+        if step != self.last_model_step and (force or step % self.interval == 0):
+            self.model_rows.append([step] + [reporter(model) for reporter in self.model_reporters.values()])
+            self.last_model_step = step
+        if self.agent_reporters and step != self.last_agent_step and (force or step % self.agent_interval == 0):
+            agents = [a for a in model.schedule.agents if self.agent_filter(a)]
+            columns = {"Step": np.full(len(agents), step), "AgentID": np.array([a.unique_id for a in agents])}
+            for name, reporter in self.agent_reporters.items():
+                columns[name] = np.array([reporter(a) for a in agents])
+            self.agent_rows.append(columns)
+            self.last_agent_step = step
+        if len(self.model_rows) >= self.chunk_size or len(self.agent_rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows to a new chunk file
+        """
+        if len(self.model_rows) > 0:
+            columns = ["Step"] + list(self.model_reporters)
+            values = list(zip(*self.model_rows))
+            np.savez(os.path.join(self.path, f"model_{self.model_chunks:05d}.npz"),
+                     **{name: np.array(v) for name, v in zip(columns, values)})
+            self.model_chunks += 1
+            self.model_rows = []
+        if len(self.agent_rows) > 0:
+            np.savez(os.path.join(self.path, f"agents_{self.agent_chunks:05d}.npz"),
+                     **{name: np.concatenate([rows[name] for rows in self.agent_rows]) for name in self.agent_rows[0]})
+            self.agent_chunks += 1
+            self.agent_rows = []
+
+    def close(self, model=None):
+        """
+        Record the last state of the model if it was not sampled, and write what is left in the buffers
+        """
+        if model is not None:
+            self.collect(model, force=True)
+        self.flush()
+
+    def get_model_vars_dataframe(self):
+        self.flush()
+        return load_model_vars(self.path)
+
+    def get_agent_vars_dataframe(self):
+        self.flush()
+        return load_agent_vars(self.path)
+
+
+def load_columns(path, prefix):
+    columns = {}
+    for f in sorted(glob.glob(os.path.join(path, f"{prefix}_*.npz"))):
+        with np.load(f) as chunk:
+            for name in chunk.files:
+                columns.setdefault(name, []).append(chunk[name])
+    return {name: np.concatenate(values) for name, values in columns.items()}
+
+
+def load_model_vars(path):
+    """
+    Read the model metrics written by a StreamingCollector, indexed by step
+    """
+    columns = load_columns(path, "model")
+    return pd.DataFrame(columns).set_index("Step") if len(columns) > 0 else pd.DataFrame()
+
+
+def load_agent_vars(path):
+    """
+    Read the agent metrics written by a StreamingCollector, indexed by (Step, AgentID) like mesa's DataCollector
+    """
+    columns = load_columns(path, "agents")
+    return pd.DataFrame(columns).set_index(["Step", "AgentID"]) if len(columns) > 0 else pd.DataFrame()
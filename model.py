@@ -1,20 +1,25 @@
 from mesa import Agent, Model
-from mesa.time import RandomActivation
 from mesa.datacollection import DataCollector
-import random
-import tkinter as tk
+import numpy as np
 from tqdm import trange
-from time import sleep
 
 from agents import Robot, GreenRobot, YellowRobot, RedRobot, CommunicatingGreenRobot, CommunicatingYellowRobot, CommunicatingRedRobot, RandomGreenRobot, RandomYellowRobot, RandomRedRobot
 from objects import GreenWasteAgent, HazardGrid, WasteAgent, YellowWasteAgent, RedWasteAgent
+from render import TkRenderer
+from metrics import StreamingCollector
+from schedule import RobotActivation, SimultaneousRobotActivation
 
-from mesa_com.communication import MessageService, CommunicatingAgent
+from mesa_com.communication import MessageService, MessageLog, CommunicatingAgent
 
 
 class Environnement(Model):
-    def __init__(self, Nr, Nw, L, H, debug=False, draw=True):
+    def __init__(self, Nr, Nw, L, H, debug=False, draw=True, delay=0.1, seed=None, metrics_dir=None, metrics_interval=1,
+                 keep_archive=False, staged_activation=False, simultaneous=False, workers=None):
         super().__init__()
+        # every source of randomness of the run comes from these two generators, owned by the model
+        if seed is not None:
+            self.reset_randomizer(seed)
+        self.np_random = np.random.default_rng(self.random.getrandbits(64))
         self.spawn_rate = 0.0
         self.debug = debug
         self.draw = draw
@@ -24,59 +29,114 @@ class Environnement(Model):
         self.grid_len = L
         self.grid_height = H
         self.full_recycled = 0
-        self.schedule = RandomActivation(self)
-        self.datacollector = DataCollector(
-            agent_reporters={"Carry": lambda a: len(a.inventory) if hasattr(a, "inventory") else 0},
-            model_reporters={"NbWaste": lambda m: len([a for a in m.schedule.agents if isinstance(a, WasteAgent) and not a.suppressed]),
-                            "FullRecycled": lambda m: m.full_recycled,
-                            "green": lambda m: len([a for a in m.schedule.agents if isinstance(a, GreenWasteAgent) and not a.suppressed]),
-                            "yellow": lambda m: len([a for a in m.schedule.agents if isinstance(a, YellowWasteAgent) and not a.suppressed]),
-                            "red": lambda m: len([a for a in m.schedule.agents if isinstance(a, RedWasteAgent) and not a.suppressed])}
-        )
+        # running counters read by the reporters : wastes not suppressed and messages sent, by color
+        self.waste_counts = {"green": 0, "yellow": 0, "red": 0}
+        self.messages_count = {"green": 0, "yellow": 0, "red": 0}
+        # only the robots are activated, green ones first, then yellow, then red if staged_activation
+        # if simultaneous, they all decide on the same state of the grid (in workers threads), then act in this order
+        if simultaneous:
+            self.schedule = SimultaneousRobotActivation(self, workers=workers, staged=staged_activation)
+        else:
+            self.schedule = RobotActivation(self, staged=staged_activation)
+        # consumed wastes leave the schedule, (unique_id, type, step) of each is kept here if keep_archive
+        self.keep_archive = keep_archive
+        self.archive = []
+        # metrics are kept in memory, or streamed to metrics_dir if given
+        self.metrics_dir = metrics_dir
+        self.metrics_interval = metrics_interval
+        self.datacollector = self.make_collector(self.get_model_reporters())
         
         # Grid
-        master = tk.Tk()
-        width = L*60+40
-        height = H*60+40
-        master.geometry(f"{width}x{height}")
-        self.master = master
-        # Paramètres = (master, width, height, n_zones=3)
-        self.grid = HazardGrid(master, L, H, 3)
+        # Paramètres = (width, height, n_zones=3, rng, np_rng)
+        self.grid = HazardGrid(L, H, 3, self.random, self.np_random)
+
+        # Renderers are optional : without any the model runs headless at full speed
+        self.renderers = []
+        if self.draw:
+            self.attach_renderer(TkRenderer(self.grid, delay=delay))
 
         self.spawn_agents()
 
+    def get_model_reporters(self):
+        return {"NbWaste": lambda m: sum(m.waste_counts.values()),
+                "FullRecycled": lambda m: m.full_recycled,
+                "green": lambda m: m.waste_counts["green"],
+                "yellow": lambda m: m.waste_counts["yellow"],
+                "red": lambda m: m.waste_counts["red"]}
+
+    def make_collector(self, model_reporters):
+        agent_reporters = {"Carry": lambda a: len(a.inventory) if hasattr(a, "inventory") else 0}
+        if self.metrics_dir is None:
+            return DataCollector(agent_reporters=agent_reporters, model_reporters=model_reporters)
+        return StreamingCollector(self.metrics_dir, model_reporters, agent_reporters, self.metrics_interval)
+
+    def attach_renderer(self, renderer):
+        """
+        Attach a renderer, called with the current step after each step of the simulation
+        """
+        self.renderers.append(renderer)
+
+    def render(self):
+        step = self.schedule.steps
+        for renderer in self.renderers:
+            renderer.render(step)
+
+    def close_renderers(self):
+        for renderer in self.renderers:
+            renderer.close()
+
+    def register_waste(self, waste):
+        """
+        Add a new waste to the schedule and to the counters
+        """
+        self.schedule.add(waste)
+        self.waste_counts[waste.type.lower()] += 1
+
+    def create_waste(self, waste_class, pos):
+        """
+        Create a waste and put it on the grid
+        """
+        w = waste_class(self.next_id(), self, pos)
+        self.grid.place_agent(w, pos)
+        self.register_waste(w)
+        return w
+
+    def suppress_waste(self, waste):
+        """
+        Mark a waste as consumed (transformed or put away) and retire it from the schedule
+        """
+        waste.suppressed = True
+        self.waste_counts[waste.type.lower()] -= 1
+        self.schedule.remove(waste)
+        if self.keep_archive:
+            self.archive.append((waste.unique_id, waste.type, self.schedule.steps))
+
     def spawn_agents(self):
         # Agents Waste
         # self.W = dict()
         Nwg, Nwy, Nwr = int(self.num_waste*0.7), int(self.num_waste*0.2), int(self.num_waste*0.1)
         for i in range (Nwg):
             # put green wastes in the first zone
-            pos = (random.randint(0, self.grid_len//3-1), random.randint(0, self.grid_height-1))
-            w = GreenWasteAgent(self.next_id(), self, pos)
-            self.grid.place_agent(w, pos)
+            pos = (self.random.randint(0, self.grid_len//3-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(GreenWasteAgent, pos) # gerer par les données de radio-activité
             # self.W.append(w)
-            self.schedule.add(w) # gerer par les données de radio-activité
         for i in range (Nwy):
             # put yellow wastes in the second zone
-            pos = (random.randint(self.grid_len//3, 2*self.grid_len//3-1), random.randint(0, self.grid_height-1))
-            w = YellowWasteAgent(self.next_id(), self, pos)
-            self.grid.place_agent(w, pos)
+            pos = (self.random.randint(self.grid_len//3, 2*self.grid_len//3-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(YellowWasteAgent, pos)
             # self.W.append(w)
-            self.schedule.add(w)
         for i in range (Nwr):
             # put red wastes in the third zone
-            pos = (random.randint(2*self.grid_len//3, self.grid_len-1), random.randint(0, self.grid_height-1))
-            w = RedWasteAgent(self.next_id(), self, pos)
-            self.grid.place_agent(w, pos)
+            pos = (self.random.randint(2*self.grid_len//3, self.grid_len-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(RedWasteAgent, pos)
             # self.W.append(w)
-            self.schedule.add(w)
 
         # Agents Robots
         robot_classes = [GreenRobot, YellowRobot, RedRobot]
         for nb, classe, i in zip(self.num_robots, robot_classes, range(len(self.num_robots))):
             for j in range(nb):
                 # get a random position in the according zone
-                pos = random.randint(i*self.grid_len//3, (i+1)*self.grid_len//3-1), random.randint(0, self.grid_height-1)
+                pos = self.random.randint(i*self.grid_len//3, (i+1)*self.grid_len//3-1), self.random.randint(0, self.grid_height-1)
                 a = classe(self.next_id(), self, pos)
                 self.grid.place_agent(a, pos)
                 self.schedule.add(a)
@@ -104,32 +164,32 @@ class Environnement(Model):
             if isinstance(agent, GreenRobot):
                 if len(agent.inventory) == 2:
                     for waste in agent.inventory:
-                        waste.suppressed = True
+                        self.suppress_waste(waste)
                     waste = YellowWasteAgent(self.next_id(), self, agent.pos)
-                    self.schedule.add(waste)
+                    self.register_waste(waste)
                     grid_wastes = self.grid.get_wastes()
                 else:
                     waste = kwargs["waste"]
                     self.grid.place_agent(waste, agent.pos)
                     grid_wastes = self.grid.get_wastes()
                     # exclude the waste dropped by the agent
-                    grid_wastes["green"].remove(waste)
+                    grid_wastes["green"] = tuple(w for w in grid_wastes["green"] if w is not waste)
             elif isinstance(agent, YellowRobot):
                 if len(agent.inventory) == 2:
                     for waste in agent.inventory:
-                        waste.suppressed = True
+                        self.suppress_waste(waste)
                     waste = RedWasteAgent(self.next_id(), self, agent.pos)
-                    self.schedule.add(waste)
+                    self.register_waste(waste)
                     grid_wastes = self.grid.get_wastes()
                 else:
                     waste = kwargs["waste"]
                     self.grid.place_agent(waste, agent.pos)
                     grid_wastes = self.grid.get_wastes()
                     # exclude the waste dropped by the agent
-                    grid_wastes["yellow"].remove(waste)
+                    grid_wastes["yellow"] = tuple(w for w in grid_wastes["yellow"] if w is not waste)
             else:
                 for waste in agent.inventory:
-                    waste.suppressed = True
+                    self.suppress_waste(waste)
                 waste = None
                 self.full_recycled += 1
                 grid_wastes = self.grid.get_wastes()
@@ -152,15 +212,76 @@ class Environnement(Model):
             grid_wastes = self.grid.get_wastes()
         else:
             print("Unknown action: ", action)
-        percepts = {"pos": agent.pos, "inventory": agent.inventory, "wastes": grid_wastes, "robots": self.grid.get_robots()}
+        percepts = {"pos": agent.pos, "inventory": agent.inventory, "wastes": grid_wastes,
+                    "waste_index": self.grid.get_waste_indexes(grid_wastes), "robots": self.grid.get_robots()}
         return percepts
 
+    def perceive(self, agent, wastes=None, robots=None):
+        """
+        Percepts of an agent which does not act, wastes and robots can be given to share one copy of the registries
+        """
+        wastes = wastes if wastes is not None else self.grid.get_wastes()
+        robots = robots if robots is not None else self.grid.get_robots()
+        return {"pos": agent.pos, "inventory": agent.inventory, "wastes": wastes,
+                "waste_index": self.grid.get_waste_indexes(wastes), "robots": robots}
+
+    def is_valid(self, agent, decision, entered):
+        """
+        Check that a decision taken on the state of the grid at the beginning of the step
+        can still be applied after the decisions applied before it
+        """
+        action = decision["action"]
+        if action == "move":
+            # two robots cannot enter the same cell in a step, staying in place is always possible
+            return decision["pos"] == agent.pos or decision["pos"] not in entered
+        if action == "pick_up":
+            return decision["waste"].pos is not None and decision["waste"].pos == agent.pos
+        if action == "take":
+            # the robots are still next to each other, the taker still holds its waste and has room for another one
+            src = decision["src"]
+            return (self.grid.get_distance(agent.pos, src.pos) <= 1 and len(src.inventory) > 0
+                    and decision["waste"] in agent.inventory and len(agent.inventory) < 2)
+        if action == "give":
+            dst = decision["dest"]
+            return self.grid.get_distance(agent.pos, dst.pos) <= 1 and len(agent.inventory) > 0 and len(dst.inventory) < 2
+        return True
+
+    def yields(self, agent, decision, rank, movers):
+        """
+        Check if a robot moving next to a robot which moves before it must wait : its decision was taken
+        with a neighbouring cell occupied, which may be freed in this step. Without this priority,
+        robots blocking each other can repeat the same moves together for ever
+        rank is the position of the robot in the order of the decisions, movers the lowest rank of the robots leaving each cell
+        """
+        if decision["action"] != "move" or decision["pos"] == agent.pos:
+            return False
+        x, y = agent.pos
+        return any(movers.get(pos, rank) < rank for pos in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)))
+
+    def resolve(self, decisions):
+        """
+        Apply the decisions (agent, decision) in order, the ones in conflict with a decision applied before are dropped :
+        the agent stays where it is and only perceives the grid. A robot which yields to a neighbour (see yields) also stays
+        """
+        movers = {}
+        for rank, (agent, decision) in enumerate(decisions):
+            if decision["action"] == "move" and decision["pos"] != agent.pos:
+                movers.setdefault(agent.pos, rank)
+        entered = set()
+        for rank, (agent, decision) in enumerate(decisions):
+            if self.is_valid(agent, decision, entered) and not self.yields(agent, decision, rank, movers):
+                if decision["action"] == "move" and decision["pos"] != agent.pos:
+                    entered.add(decision["pos"])
+                agent.percepts = self.do(agent, **decision)
+            else:
+                if self.debug:
+                    print(agent.type, "Agent", agent.unique_id, "action", decision["action"], "dropped by a conflict")
+                agent.percepts = self.perceive(agent)
+
     def spawn(self, spawn_rate):
-        if random.random() < spawn_rate:
-            pos = (random.randint(0, self.grid_len//3-1), random.randint(0, self.grid_height-1))
-            w = GreenWasteAgent(self.next_id(), self, pos)
-            self.grid.place_agent(w, pos)
-            self.schedule.add(w)
+        if self.random.random() < spawn_rate:
+            pos = (self.random.randint(0, self.grid_len//3-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(GreenWasteAgent, pos)
             if self.debug:
                 print("New waste spawned at", pos)
 
@@ -169,25 +290,37 @@ class Environnement(Model):
 
         self.datacollector.collect(self)
         self.schedule.step()
-        step = self.schedule.steps
-        if self.draw:
-            self.grid.draw(step)
-        self.master.update()
-        sleep(0.1)
+        self.render()
         self.spawn(self.spawn_rate)
     
     def count_wastes(self):
-        return len([a for a in self.schedule.agents if isinstance(a, WasteAgent) and a.pos is not None])
+        """
+        Number of wastes lying on the grid
+        """
+        return sum(len(wastes) for wastes in self.grid.wastes.values())
+
+    def get_robots(self):
+        return [a for robots in self.grid.robots.values() for a in robots]
 
     # 2. this method performs only n steps for all agents
     def run_n_steps(self,n):
-        for i in trange(n):
-            self.one_step()
+        try:
+            for i in trange(n):
+                self.one_step()
+        finally:
+            self.flush_metrics()
+
+    def flush_metrics(self):
+        """
+        Write the metrics streamed to metrics_dir which are still buffered, the run can go on after
+        """
+        if self.metrics_dir is not None:
+            self.datacollector.flush()
 
     def terminated(self):
         if self.count_wastes() == 0:
             # check robots' inventories and see if green or yellow robots have 2 wastes, or red robots have 1 waste
-            for a in self.schedule.agents:
+            for a in self.get_robots():
                 if isinstance(a, GreenRobot) or isinstance(a, YellowRobot):
                     if len(a.inventory) == 2:
                         return False
@@ -197,20 +330,31 @@ class Environnement(Model):
             return True
         return False
     
-    def run_while(self):
-        while not self.terminated():
-            # print(self.count_wastes())
-            self.one_step()
-            nsteps = self.schedule.steps
-            if (nsteps % 10 == 0 or self.terminated()) and self.debug:
-                # print with a color the following message: "Wastes remaining in inventories: {len([a for a in self.schedule.agents if isinstance(a, WasteAgent) and not a.suppressed])}"
-                print(f"\033[1;32;40mWastes remaining in inventories: {len([a for a in self.schedule.agents if isinstance(a, WasteAgent) and not a.suppressed])} : \n\t {sum([len(a.inventory) for a in self.schedule.agents if isinstance(a, GreenRobot)])} green, {sum([len(a.inventory) for a in self.schedule.agents if isinstance(a, YellowRobot)])} yellow, {sum([len(a.inventory) for a in self.schedule.agents if isinstance(a, RedRobot)])} red : \n\t\t {[f'{a.type} Robot {a.unique_id}' for a in self.schedule.agents if isinstance(a, Robot) and len(a.inventory) == 1]}\033[0m")
-        self.datacollector.collect(self)
+    def run_while(self, max_steps=None):
+        # the metrics and the renderers are closed even if the run fails, so that the files they write are complete
+        try:
+            while not self.terminated() and (max_steps is None or self.schedule.steps < max_steps):
+                # print(self.count_wastes())
+                self.one_step()
+                nsteps = self.schedule.steps
+                if (nsteps % 10 == 0 or self.terminated()) and self.debug:
+                    robots = self.get_robots()
+                    print(f"\033[1;32;40mWastes remaining in inventories: {sum(self.waste_counts.values())} : \n\t {sum([len(a.inventory) for a in robots if isinstance(a, GreenRobot)])} green, {sum([len(a.inventory) for a in robots if isinstance(a, YellowRobot)])} yellow, {sum([len(a.inventory) for a in robots if isinstance(a, RedRobot)])} red : \n\t\t {[f'{a.type} Robot {a.unique_id}' for a in robots if len(a.inventory) == 1]}\033[0m")
+            if self.metrics_dir is None:
+                self.datacollector.collect(self)
+            else:
+                self.datacollector.close(self)
+        finally:
+            self.flush_metrics()
+            self.schedule.close()
+            self.close_renderers()
 
 
 class RandomEnvironnement(Environnement):
-    def __init__(self, Nr, Nw, L, H, debug=False):
-        super().__init__(Nr, Nw, L, H, debug)
+    def __init__(self, Nr, Nw, L, H, debug=False, draw=True, delay=0.1, seed=None, metrics_dir=None, metrics_interval=1,
+                 keep_archive=False, staged_activation=False, simultaneous=False, workers=None):
+        super().__init__(Nr, Nw, L, H, debug, draw, delay, seed, metrics_dir, metrics_interval, keep_archive, staged_activation,
+                         simultaneous, workers)
 
     def spawn_agents(self):
         # Agents Waste
@@ -218,32 +362,26 @@ class RandomEnvironnement(Environnement):
         Nwg, Nwy, Nwr = int(self.num_waste*0.7), int(self.num_waste*0.2), int(self.num_waste*0.1)
         for i in range (Nwg):
             # put green wastes in the first zone
-            pos = (random.randint(0, self.grid_len//3-1), random.randint(0, self.grid_height-1))
-            w = GreenWasteAgent(self.next_id(), self, pos)
-            self.grid.place_agent(w, pos)
+            pos = (self.random.randint(0, self.grid_len//3-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(GreenWasteAgent, pos) # gerer par les données de radio-activité
             # self.W.append(w)
-            self.schedule.add(w) # gerer par les données de radio-activité
         for i in range (Nwy):
             # put yellow wastes in the second zone
-            pos = (random.randint(self.grid_len//3, 2*self.grid_len//3-1), random.randint(0, self.grid_height-1))
-            w = YellowWasteAgent(self.next_id(), self, pos)
-            self.grid.place_agent(w, pos)
+            pos = (self.random.randint(self.grid_len//3, 2*self.grid_len//3-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(YellowWasteAgent, pos)
             # self.W.append(w)
-            self.schedule.add(w)
         for i in range (Nwr):
             # put red wastes in the third zone
-            pos = (random.randint(2*self.grid_len//3, self.grid_len-1), random.randint(0, self.grid_height-1))
-            w = RedWasteAgent(self.next_id(), self, pos)
-            self.grid.place_agent(w, pos)
+            pos = (self.random.randint(2*self.grid_len//3, self.grid_len-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(RedWasteAgent, pos)
             # self.W.append(w)
-            self.schedule.add(w)
 
         # Agents Robots
         robot_classes = [RandomGreenRobot, RandomYellowRobot, RandomRedRobot]
         for nb, classe, i in zip(self.num_robots, robot_classes, range(len(self.num_robots))):
             for j in range(nb):
                 # get a random position in the according zone
-                pos = random.randint(i*self.grid_len//3, (i+1)*self.grid_len//3-1), random.randint(0, self.grid_height-1)
+                pos = self.random.randint(i*self.grid_len//3, (i+1)*self.grid_len//3-1), self.random.randint(0, self.grid_height-1)
                 a = classe(self.next_id(), self, pos)
                 self.grid.place_agent(a, pos)
                 self.schedule.add(a)
@@ -251,60 +389,70 @@ class RandomEnvironnement(Environnement):
 
 
 class CommunicationEnvironnement(Environnement):
-    def __init__(self, Nr, Nw, L, H, debug=False, draw=True):
-        super().__init__(Nr, Nw, L, H, debug, draw)
-        self.datacollector = DataCollector(
-            agent_reporters={"Carry": lambda a: len(a.inventory) if hasattr(a, "inventory") else 0},
-            model_reporters={"NbWaste": lambda m: len([a for a in m.schedule.agents if isinstance(a, WasteAgent) and not a.suppressed]),
-                            "FullRecycled": lambda m: m.full_recycled,
-                            "green": lambda m: len([a for a in m.schedule.agents if isinstance(a, GreenWasteAgent) and not a.suppressed]),
-                            "yellow": lambda m: len([a for a in m.schedule.agents if isinstance(a, YellowWasteAgent) and not a.suppressed]),
-                            "red": lambda m: len([a for a in m.schedule.agents if isinstance(a, RedWasteAgent) and not a.suppressed]),
-                            "NbMessages_green": lambda m: sum(len(a.messages_sent) for a in m.schedule.agents if isinstance(a, CommunicatingGreenRobot)),
-                            "NbMessages_yellow": lambda m: sum(len(a.messages_sent) for a in m.schedule.agents if isinstance(a, CommunicatingYellowRobot)),
-                            "NbMessages_red": lambda m: sum(len(a.messages_sent) for a in m.schedule.agents if isinstance(a, CommunicatingRedRobot))}
-
-        )
+    def __init__(self, Nr, Nw, L, H, debug=False, draw=True, delay=0.1, seed=None, metrics_dir=None, metrics_interval=1,
+                 keep_archive=False, coalescing_window=None, message_log=False, message_latency=0, staged_activation=False,
+                 simultaneous=False, workers=None, message_timeout=None):
+        # every message sent is recorded in a MessageLog if message_log
+        self.message_log = MessageLog() if message_log else None
+        # messages are delivered message_latency steps after being sent, 0 for an instant delivery
+        self.message_latency = message_latency
+        # claims received and ARGUE/COMMIT handshakes are given up after message_timeout steps (None : never)
+        # by default only with delayed messages or simultaneous activation, where robots also act on late information,
+        # long enough to cross the grid : 2 * message_latency + L + H
+        if message_timeout is None and (message_latency > 0 or simultaneous):
+            message_timeout = 2 * message_latency + L + H
+        self.message_timeout = message_timeout
+        # a claim (INFORM_REF) repeated within coalescing_window steps is dropped by the message service
+        # None : for ever, the robots remember the claims they received ; 0 : never
+        # the window is at most message_timeout, after which the receivers forget the claim and it must be sent again
+        if message_timeout is not None and (coalescing_window is None or coalescing_window > message_timeout):
+            coalescing_window = message_timeout
+        self.coalescing_window = coalescing_window
+        super().__init__(Nr, Nw, L, H, debug, draw, delay, seed, metrics_dir, metrics_interval, keep_archive, staged_activation,
+                         simultaneous, workers)
+
+    def get_model_reporters(self):
+        reporters = super().get_model_reporters()
+        reporters.update({"NbMessages_green": lambda m: m.messages_count["green"],
+                          "NbMessages_yellow": lambda m: m.messages_count["yellow"],
+                          "NbMessages_red": lambda m: m.messages_count["red"]})
+        return reporters
     
     def spawn_agents(self):
-        self.__messages_service = MessageService(self.schedule)
+        # the message service of this model, used by its communicating robots
+        self.message_service = MessageService(self.schedule, self.message_latency == 0, self.coalescing_window,
+                                              message_log=self.message_log, latency=self.message_latency)
         # Agents Waste
         # self.W = dict()
         Nwg, Nwy, Nwr = int(self.num_waste*0.7), int(self.num_waste*0.2), int(self.num_waste*0.1)
         for i in range (Nwg):
             # put green wastes in the first zone
-            pos = (random.randint(0, self.grid_len//3-1), random.randint(0, self.grid_height-1))
-            w = GreenWasteAgent(self.next_id(), self, pos)
+            pos = (self.random.randint(0, self.grid_len//3-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(GreenWasteAgent, pos) # gerer par les données de radio-activité
             if self.debug:
                 print("Green waste spawned at", pos)
-            self.grid.place_agent(w, pos)
             # self.W.append(w)
-            self.schedule.add(w) # gerer par les données de radio-activité
         for i in range (Nwy):
             # put yellow wastes in the second zone
-            pos = (random.randint(self.grid_len//3, 2*self.grid_len//3-1), random.randint(0, self.grid_height-1))
-            w = YellowWasteAgent(self.next_id(), self, pos)
+            pos = (self.random.randint(self.grid_len//3, 2*self.grid_len//3-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(YellowWasteAgent, pos)
             if self.debug:
                 print("Yellow waste spawned at", pos)
-            self.grid.place_agent(w, pos)
             # self.W.append(w)
-            self.schedule.add(w)
         for i in range (Nwr):
             # put red wastes in the third zone
-            pos = (random.randint(2*self.grid_len//3, self.grid_len-1), random.randint(0, self.grid_height-1))
-            w = RedWasteAgent(self.next_id(), self, pos)
+            pos = (self.random.randint(2*self.grid_len//3, self.grid_len-1), self.random.randint(0, self.grid_height-1))
+            w = self.create_waste(RedWasteAgent, pos)
             if self.debug:
                 print("Red waste spawned at", pos)
-            self.grid.place_agent(w, pos)
             # self.W.append(w)
-            self.schedule.add(w)
 
         # Agents Robots
         robot_classes = [CommunicatingGreenRobot, CommunicatingYellowRobot, CommunicatingRedRobot]
         for nb, classe, i in zip(self.num_robots, robot_classes, range(len(self.num_robots))):
             for j in range(nb):
                 # get a random position in the according zone
-                pos = random.randint(i*self.grid_len//3, (i+1)*self.grid_len//3-1), random.randint(0, self.grid_height-1)
+                pos = self.random.randint(i*self.grid_len//3, (i+1)*self.grid_len//3-1), self.random.randint(0, self.grid_height-1)
                 a = classe(self.next_id(), self, pos)
                 if self.debug:
                     print("Robot", a.unique_id, "spawned at", pos)
@@ -316,7 +464,7 @@ class CommunicationEnvironnement(Environnement):
         if self.count_wastes() == 0:
             nb_wastes=0
             # check robots' inventories and see if green or yellow robots have 2 wastes, or red robots have 1 waste
-            for a in self.schedule.agents:
+            for a in self.get_robots():
                 if isinstance(a, GreenRobot) or isinstance(a, YellowRobot):
                     if len(a.inventory) == 2:
                         return False
@@ -334,12 +482,8 @@ class CommunicationEnvironnement(Environnement):
 
         self.datacollector.collect(self)
         
-        self.__messages_service.dispatch_messages()
+        self.message_service.dispatch_messages()
 
         self.schedule.step()
-        step = self.schedule.steps
-        if self.draw:
-            self.grid.draw(step)
-        self.master.update()
-        sleep(0.1)
+        self.render()
         self.spawn(self.spawn_rate)
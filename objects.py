@@ -3,22 +3,91 @@ from mesa.agent import Agent
 import matplotlib.pyplot as plt
 import numpy as np
 import random
-import tkinter as tk
-from PIL import Image, ImageTk
+import heapq
+import threading
+from collections import OrderedDict, deque
 from agents import Robot
 
 ##################
 ###### Grid ######
 ##################
+class WasteIndex:
+    """
+    Spatial index of the wastes of one color
+    The grid is cut in square buckets of bucket_size cells : a nearest query visits the buckets
+    ring by ring around the position and stops as soon as no unvisited bucket can hold a closer waste
+    Each waste has a rank, its insertion order : like min() over the list of wastes, ties go to the first one
+    """
+
+    def __init__(self, width, height, bucket_size=4):
+        self.bucket_size = bucket_size
+        self.n_x = (width - 1) // bucket_size + 1
+        self.n_y = (height - 1) // bucket_size + 1
+        self.buckets = {}
+        self.size = 0
+        self.next_rank = 0
+
+    def __len__(self):
+        return self.size
+
+    def get_bucket(self, pos):
+        return pos[0] // self.bucket_size, pos[1] // self.bucket_size
+
+    def add(self, waste, pos):
+        self.buckets.setdefault(self.get_bucket(pos), {})[waste] = pos, self.next_rank
+        self.size += 1
+        self.next_rank += 1
+
+    def remove(self, waste, pos):
+        bucket = self.get_bucket(pos)
+        del self.buckets[bucket][waste]
+        if len(self.buckets[bucket]) == 0:
+            del self.buckets[bucket]
+        self.size -= 1
+
+    def get_ring(self, bucket, r):
+        """
+        Buckets at Chebyshev distance r of the given bucket (in bucket units), clipped to the grid
+        """
+        bx, by = bucket
+        if r == 0:
+            return [bucket]
+        ring = []
+        for x in range(max(bx - r, 0), min(bx + r, self.n_x - 1) + 1):
+            for y in (by - r, by + r):
+                if 0 <= y < self.n_y:
+                    ring.append((x, y))
+        for y in range(max(by - r + 1, 0), min(by + r - 1, self.n_y - 1) + 1):
+            for x in (bx - r, bx + r):
+                if 0 <= x < self.n_x:
+                    ring.append((x, y))
+        return ring
+
+    def nearest(self, pos, k=1, exclude=()):
+        """
+        Get the k wastes closest to pos (Manhattan distance), ignoring the wastes in exclude
+        and the ones which are no longer where they were added (picked up since)
+        """
+        if self.size == 0 or k <= 0:
+            return []
+        bucket = self.get_bucket(pos)
+        candidates = []
+        for r in range(max(self.n_x, self.n_y)):
+            for b in self.get_ring(bucket, r):
+                for waste, ((x, y), rank) in self.buckets.get(b, {}).items():
+                    if waste not in exclude and waste.pos == (x, y):
+                        candidates.append((abs(pos[0] - x) + abs(pos[1] - y), rank, waste))
+            # every waste in a bucket of ring r+1 is at least r*bucket_size+1 cells away
+            if len(candidates) >= k and heapq.nsmallest(k, candidates)[-1][0] <= r * self.bucket_size:
+                break
+        return [waste for _, _, waste in heapq.nsmallest(k, candidates)]
+
 class HazardGrid(MultiGrid):
-    def __init__(self, master, width, height, n_zones=3):
+    def __init__(self, width, height, n_zones=3, rng=None, np_rng=None):
         super().__init__(width, height, False)
-        self.master = master
-        self.cell_width = 60
-        self.cell_height = 60
-
-        self.canvas = tk.Canvas(self.master, width=self.width*self.cell_width, height=self.height*self.cell_height+40)
-        self.canvas.pack()
+        # random generators of the model, fresh unseeded ones if the grid is used on its own
+        self.rng = rng if rng is not None else random.Random()
+        self.np_rng = np_rng if np_rng is not None else np.random.default_rng()
         self.width = width
         self.height = height
         self.n_zones = n_zones
@@ -31,17 +100,80 @@ class HazardGrid(MultiGrid):
         # print("n_zones = ",n_zones)
         for i in range(n_zones):
             # for each zone, assign a random radioactivity level
-            random_values = np.random.uniform(i / n_zones, (i + 1) / n_zones, (self.height, self.zone_widths[i]))
+            random_values = self.np_rng.uniform(i / n_zones, (i + 1) / n_zones, (self.height, self.zone_widths[i]))
             self.radioactivity_map[:, sum(self.zone_widths[:i]):sum(self.zone_widths[:i+1])] = random_values
         # General waste disposal zone : 200 radioactivity at end of red zone, arbitrary y
-        self.radioactivity_map[random.randint(0, self.height-1), -1] = 2
+        self.radioactivity_map[self.rng.randint(0, self.height-1), -1] = 2
+        # incremented each time the map changes, for the caches built on it
+        self.radioactivity_version = 0
         # print("radioactivity_map = ",self.radioactivity_map)
+        # registries of the agents on the grid by color, kept up to date by place/remove/move_agent
+        # dicts are used as ordered sets : insertion and removal in O(1)
+        self.wastes = {"green": {}, "yellow": {}, "red": {}}
+        self.robots = {"green": {}, "yellow": {}, "red": {}}
+        self.waste_index = {color: WasteIndex(width, height) for color in self.wastes}
+        # immutable copies of the registries given to the robots, rebuilt only for the colors which changed (None)
+        self.waste_tuples = dict.fromkeys(self.wastes)
+        # nearest-waste indexes built on these copies, for the robots to search their knowledge
+        self.waste_tuple_indexes = dict.fromkeys(self.wastes)
+        self.robot_tuples = dict.fromkeys(self.robots)
+        # BFS distance fields by (target, radioactivity_limit), least recently used ones are dropped first
+        # at most 256 fields, and at most max_cached_cells cells in total (int32 : 64 MB)
+        self.distance_fields = OrderedDict()
+        self.max_cached_cells = 2**24
+        self.max_distance_fields = max(1, min(256, self.max_cached_cells // (width * height)))
+        # robots deliberating in parallel share the cache
+        self.distance_fields_lock = threading.Lock()
+        # RGB colors of the cells, for the current radioactivity_version
+        self.color_layer = None
         # No waste, just ground
         # for _ in range(0, 30):
         #     i = np.random.randint(0, self.height)
         #     j = np.random.randint(0, self.width+1)
         #     self.radioactivity_map[i][j] = 10
     
+    def set_radioactivity(self, pos, value):
+        """
+        Change the radioactivity of a cell, the cached distance fields are no longer valid
+        """
+        x, y = pos
+        self.radioactivity_map[y, x] = value
+        self.distance_fields.clear()
+        self.radioactivity_version += 1
+
+    def get_distance_field(self, target, radioactivity_limit):
+        """
+        Get the number of steps from every cell to target, moving only through cells whose
+        radioactivity is below radioactivity_limit (-1 if target cannot be reached)
+        The field is indexed by position : field[x, y]. It is computed once by BFS and cached
+        """
+        key = (tuple(target), radioactivity_limit)
+        with self.distance_fields_lock:
+            if key in self.distance_fields:
+                self.distance_fields.move_to_end(key)
+                return self.distance_fields[key]
+        allowed = (self.radioactivity_map.T <= radioactivity_limit).tolist()
+        # the BFS runs on lists, faster to index from Python than an array
+        field = [[-1] * self.height for _ in range(self.width)]
+        x, y = key[0]
+        field[x][y] = 0
+        queue = deque([key[0]])
+        while queue:
+            x, y = queue.popleft()
+            d = field[x][y] + 1
+            for nx, ny in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)):
+                if 0 <= nx < self.width and 0 <= ny < self.height and field[nx][ny] == -1:
+                    field[nx][ny] = d
+                    # a robot can start from any cell, but can only go through allowed ones
+                    if allowed[nx][ny]:
+                        queue.append((nx, ny))
+        field = np.array(field, dtype=np.int32)
+        with self.distance_fields_lock:
+            self.distance_fields[key] = field
+            while len(self.distance_fields) > self.max_distance_fields:
+                self.distance_fields.popitem(last=False)
+        return field
+
     def get_zone(self, pos):
         """
         Get the zone of a position
@@ -53,6 +185,55 @@ class HazardGrid(MultiGrid):
             x -= self.zone_widths[i]
         return self.n_zones
 
+    def get_registry(self, agent):
+        """
+        Get the registry in which the agent is stored, None if the agent is neither a waste nor a robot
+        """
+        if isinstance(agent, WasteAgent):
+            return self.wastes[agent.type.lower()]
+        if isinstance(agent, Robot):
+            return self.robots[agent.type.lower()]
+        return None
+
+    def invalidate_tuples(self, agent):
+        """
+        The registry of the agent changed : its copy given by get_wastes or get_robots must be rebuilt
+        """
+        if isinstance(agent, WasteAgent):
+            self.waste_tuples[agent.type.lower()] = None
+            self.waste_tuple_indexes[agent.type.lower()] = None
+        else:
+            self.robot_tuples[agent.type.lower()] = None
+
+    def place_agent(self, agent, pos):
+        super().place_agent(agent, pos)
+        registry = self.get_registry(agent)
+        if registry is not None and agent not in registry:
+            registry[agent] = None
+            self.invalidate_tuples(agent)
+            if isinstance(agent, WasteAgent):
+                self.waste_index[agent.type.lower()].add(agent, pos)
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        super().remove_agent(agent)
+        registry = self.get_registry(agent)
+        if registry is not None and agent in registry:
+            del registry[agent]
+            self.invalidate_tuples(agent)
+            if isinstance(agent, WasteAgent):
+                self.waste_index[agent.type.lower()].remove(agent, pos)
+
+    def move_agent(self, agent, pos):
+        # the agent stays on the grid : registries are left untouched
+        pos = self.torus_adj(pos)
+        old_pos = agent.pos
+        super().remove_agent(agent)
+        super().place_agent(agent, pos)
+        if isinstance(agent, WasteAgent):
+            self.waste_index[agent.type.lower()].remove(agent, old_pos)
+            self.waste_index[agent.type.lower()].add(agent, pos)
+
     def get_all_agents(self):
         """
         Get all the agents in the grid
@@ -68,31 +249,62 @@ class HazardGrid(MultiGrid):
     def get_wastes(self):
         """
         Get the wastes positions
-        Returns a dictionary with the type of waste as key and a list of agents as value
+        Returns a dictionary with the type of waste as key and a tuple of agents as value
+        The tuples are copies of the registries, shared between the calls until the registry of their color changes
         """
-        wastes = {
-            "green": [],
-            "yellow": [],
-            "red": []
-        }
-        for agent in self.get_all_agents():
-            if isinstance(agent, WasteAgent):
-                wastes[agent.type.lower()].append(agent)
-        return wastes
+        return self.get_tuples(self.wastes, self.waste_tuples)
+
+    def get_waste_indexes(self, wastes=None):
+        """
+        Get a nearest-waste index of each color built on the wastes given by get_wastes (or on wastes)
+        The indexes of the shared tuples are shared as well, the other ones are built for the call
+        """
+        wastes = wastes if wastes is not None else self.get_wastes()
+        indexes = {}
+        for color, known in wastes.items():
+            if known is not self.waste_tuples[color]:
+                indexes[color] = self.build_waste_index(known)
+                continue
+            if self.waste_tuple_indexes[color] is None:
+                self.waste_tuple_indexes[color] = self.build_waste_index(known)
+            indexes[color] = self.waste_tuple_indexes[color]
+        return indexes
+
+    def build_waste_index(self, wastes):
+        """
+        Get a nearest-waste index of the given wastes, ranked in their order
+        """
+        index = WasteIndex(self.width, self.height)
+        for waste in wastes:
+            index.add(waste, waste.pos)
+        return index
+
+    def get_tuples(self, registries, tuples):
+        for color, registry in registries.items():
+            if tuples[color] is None:
+                tuples[color] = tuple(registry)
+        return dict(tuples)
+
+    def closest_waste(self, color, pos, exclude=()):
+        """
+        Get the waste of the given color closest to pos, None if there is none
+        exclude is a container of wastes to ignore (e.g. already claimed by other robots)
+        """
+        wastes = self.waste_index[color].nearest(pos, 1, exclude)
+        return wastes[0] if len(wastes) > 0 else None
+
+    def nearest_wastes(self, color, pos, k, exclude=()):
+        """
+        Get the k wastes of the given color closest to pos, sorted by distance
+        """
+        return self.waste_index[color].nearest(pos, k, exclude)
 
     def get_robots(self):
         """
         Get the robots positions
+        Returns a dictionary with the color as key and a tuple of robots as value, shared like the ones of get_wastes
         """
-        robots = {
-            "green": [],
-            "yellow": [],
-            "red": []
-        }
-        for agent in self.get_all_agents():
-            if isinstance(agent, Robot):
-                robots[agent.type.lower()].append(agent)
-        return robots
+        return self.get_tuples(self.robots, self.robot_tuples)
 
     def get_distance(self, pos1, pos2):
         """
@@ -102,62 +314,6 @@ class HazardGrid(MultiGrid):
             return np.inf
         return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
 
-    def draw(self, step):
-        """
-        Draw the grid with wastes and robots
-        """
-        self.canvas.delete("all")
-        wastes_pos = {}
-        robots_pos = {}
-        for agent in self.get_all_agents():
-            if isinstance(agent, WasteAgent):
-                if agent.pos is None:
-                    continue
-                wastes_pos[agent] = agent.pos
-            elif isinstance(agent, Robot):
-                for w in agent.inventory:
-                    wastes_pos[w] = agent.pos
-                robots_pos[agent] = agent.pos
-
-        for i in range(self.height):
-            for j in range(self.width):
-                x0 = j * self.cell_width
-                y0 = i * self.cell_height
-                x1 = x0 + self.cell_width
-                y1 = y0 + self.cell_height
-                color = self.get_color(self.radioactivity_map[i][j])
-                self.canvas.create_rectangle(x0, y0, x1, y1, fill=color)
-        self.images = []
-        for waste in wastes_pos:
-            pos = wastes_pos[waste]
-            x = pos[0] * self.cell_width + self.cell_width / 2
-            y = pos[1] * self.cell_height + self.cell_height / 2
-            fill = 'green' if waste.type == "Green" else 'yellow' if waste.type == "Yellow" else 'red'
-            
-            # text_item = self.canvas.create_text(x, y, text="■", fill=fill, anchor='center', font=("Helvetica", 16, "bold"))
-            # bbox = self.canvas.bbox(text_item)
-            # rect_item = self.canvas.create_rectangle(bbox, outline="white", fill="black")
-            # add the waste png image at the position
-            image = Image.open(f"images/{waste.type.lower()}_waste.png")
-            image = image.resize((self.cell_width, self.cell_height), Image.Resampling.LANCZOS)
-            image = ImageTk.PhotoImage(image)
-            img_item = self.canvas.create_image(x, y, image=image, anchor='center')
-            self.images.append(image)
-        self.canvas.update()
-
-        for robot in robots_pos:
-            pos = robots_pos[robot]
-            x = pos[0] * self.cell_width + self.cell_width / 2
-            y = pos[1] * self.cell_height + self.cell_height / 2
-            fill = 'green' if robot.type == "green" else 'yellow' if robot.type == "yellow" else 'red'
-            text_item = self.canvas.create_text(x, y, text="ඞ", fill=fill, anchor='center', font=("Helvetica", 16, "bold"))
-            bbox = self.canvas.bbox(text_item)
-            rect_item = self.canvas.create_rectangle(bbox, outline="white", fill="black")
-            self.canvas.tag_raise(text_item,rect_item)
-        
-        # add text below the grid to show the current step
-        self.canvas.create_text(20, self.height * self.cell_height + 10, anchor='w', text=f"Step {step}", font=("Helvetica", 16, "bold"))
-    
     def print(self):
         """
         Plot the grid with wastes and robots
@@ -172,7 +328,7 @@ class HazardGrid(MultiGrid):
             elif isinstance(agent, Robot):
                 robots_pos[agent] = agent.pos
         fig, ax = plt.subplots()
-        ax.imshow(self.radioactivity_map, cmap='afmhot', interpolation='nearest')
+        ax.imshow(self.get_color_layer(), interpolation='nearest')
         for waste in wastes_pos:
             # adds a "W" to the waste position
             pos = wastes_pos[waste]
@@ -185,6 +341,31 @@ class HazardGrid(MultiGrid):
             ax.text(pos[0], pos[1], "R", color=color, fontsize=12)
         plt.show()
 
+    def get_color_layer(self):
+        """
+        Get the RGB colors of the cells, an array of shape (height, width, 3) computed once like get_color
+        """
+        if self.color_layer is None or self.color_layer[0] != self.radioactivity_version:
+            r = self.radioactivity_map
+            layer = np.empty(r.shape + (3,), dtype=np.uint8)
+            # default color for any other radioactivity value
+            layer[:] = (160, 147, 225)
+            conditions = [r < 1/3, (r >= 1/3) & (r < 2/3), (r > 2/3) & (r < 1), r == 2, r == 10]
+            # the branches of get_color, in reverse order so that the first matching one wins
+            colors = [
+                (np.zeros_like(r), np.trunc(255 * (r / (1/3))), np.zeros_like(r)),
+                (np.full_like(r, 230), np.trunc(255 * ((2/3 - r) / (1/3))), np.zeros_like(r)),
+                (np.trunc(255 * ((1 - r) / (1/3))), np.zeros_like(r), np.zeros_like(r)),
+                (95, 95, 95),
+                (217, 225, 147),
+            ]
+            for condition, color in reversed(list(zip(conditions, colors))):
+                for channel in range(3):
+                    value = color[channel]
+                    layer[..., channel][condition] = value[condition] if isinstance(value, np.ndarray) else value
+            self.color_layer = (self.radioactivity_version, layer)
+        return self.color_layer[1]
+
     def get_color(self, radioactivity):
         # Map radioactivity to shades of yellow, orange, and red
         if radioactivity < 1/3:
@@ -219,13 +400,6 @@ class HazardGrid(MultiGrid):
             blue = 225
 
         return "#{:02x}{:02x}{:02x}".format(red, green, blue)
-if __name__=="__main__":
-    root = tk.Tk()
-    root.geometry("400x300")
-    grid = HazardGrid(root, 15, 15, 3)
-    grid.draw([(1, 1), (2, 2)], [(3, 3), (4, 4)])
-    root.mainloop()
-
 
 
 ##########################
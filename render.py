@@ -0,0 +1,428 @@
+import os
+import shutil
+import subprocess
+import threading
+import tkinter as tk
+from collections import deque, namedtuple
+from time import sleep, perf_counter
+import numpy as np
+from PIL import Image, ImageTk, ImageDraw, GifImagePlugin
+
+######################
+###### Snapshots #####
+######################
+
+# What the renderers draw, copied from the grid after a step : wastes (on the grid or carried)
+# and robots as tuples (unique_id, type, pos), and the colors of the cells. It does not change when the simulation goes on :
+# the grid builds a new color layer when the radioactivity changes, the one of a snapshot is never modified
+Snapshot = namedtuple("Snapshot", ["step", "radioactivity_version", "color_layer", "wastes", "robots"])
+
+
+def take_snapshot(grid, step):
+    wastes = [(w.unique_id, w.type, w.pos) for color in grid.wastes.values() for w in color]
+    robots = []
+    for color in grid.robots.values():
+        for r in color:
+            wastes.extend((w.unique_id, w.type, r.pos) for w in r.inventory)
+            robots.append((r.unique_id, r.type, r.pos))
+    return Snapshot(step, grid.radioactivity_version, grid.get_color_layer(), tuple(wastes), tuple(robots))
+
+
+def get_background_image(color_layer, cell_width, cell_height):
+    """
+    Get a PIL image of the cells colored by color_layer, cell_width x cell_height pixels each with a black border
+    """
+    pixels = np.repeat(np.repeat(color_layer, cell_height, axis=0), cell_width, axis=1)
+    pixels[::cell_height, :] = 0
+    pixels[:, ::cell_width] = 0
+    return Image.fromarray(pixels)
+
+
+class SnapshotQueue:
+    """
+    Bounded queue of snapshots between a simulation and a renderer running in another thread.
+    The model publishes a snapshot after each step through render(step). When the queue is full
+    the oldest snapshot is dropped : a slow renderer skips frames instead of slowing the simulation.
+    With drop=False the simulation waits for the renderer instead, so that no frame is lost
+    """
+
+    def __init__(self, grid, max_size=2, drop=True):
+        self.grid = grid
+        self.max_size = max_size
+        self.drop = drop
+        # maxlen drops the oldest item, the condition wakes up a simulation waiting for room
+        self.snapshots = deque(maxlen=max_size)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.published = 0
+        self.consumed = 0
+
+    def render(self, step):
+        snapshot = take_snapshot(self.grid, step)
+        with self.condition:
+            while not self.drop and not self.closed and len(self.snapshots) >= self.max_size:
+                self.condition.wait()
+            self.snapshots.append(snapshot)
+            self.published += 1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def pop(self):
+        """
+        Get the oldest snapshot of the queue, None if it is empty
+        """
+        with self.condition:
+            if len(self.snapshots) == 0:
+                return None
+            snapshot = self.snapshots.popleft()
+            self.consumed += 1
+            self.condition.notify_all()
+        return snapshot
+
+    def finished(self):
+        """
+        True when the simulation is over and every snapshot left was consumed
+        """
+        return self.closed and len(self.snapshots) == 0
+
+    def get_dropped(self):
+        return self.published - self.consumed - len(self.snapshots)
+
+
+######################
+###### Renderers #####
+######################
+
+class TkRenderer:
+    """
+    Live Tk window showing a HazardGrid.
+    The simulation does not depend on it : the model only calls render(step) after each step
+    and close() at the end of the run, so any object with these two methods can be attached
+    """
+
+    def __init__(self, grid, master=None, cell_size=60, delay=0.1):
+        self.grid = grid
+        self.cell_width = cell_size
+        self.cell_height = cell_size
+        self.delay = delay
+        if master is None:
+            master = tk.Tk()
+            master.geometry(f"{grid.width*cell_size+40}x{grid.height*cell_size+40}")
+        self.master = master
+        self.canvas = tk.Canvas(self.master, width=grid.width*self.cell_width, height=grid.height*self.cell_height+40)
+        self.canvas.pack()
+        # waste sprites, loaded and resized once : (waste type, width, height) -> PhotoImage
+        self.sprites = {}
+        # canvas items of each agent drawn, and the position they are drawn at : unique_id -> (ids, pos)
+        self.items = {}
+        self.background_version = None
+        self.step_item = self.canvas.create_text(20, grid.height * self.cell_height + 10, anchor='w', text="",
+                                                 font=("Helvetica", 16, "bold"))
+
+    def render(self, step):
+        self.show(take_snapshot(self.grid, step))
+
+    def show(self, snapshot):
+        self.draw(snapshot)
+        self.master.update()
+        if self.delay > 0:
+            sleep(self.delay)
+
+    def play(self, snapshots, fps=25):
+        """
+        Show the snapshots of a SnapshotQueue fed by a simulation running in another thread,
+        at most fps frames per second, until the simulation is over. Tk must run in the main thread
+        """
+        period = max(int(1000 / fps), 1)
+
+        def poll():
+            snapshot = snapshots.pop()
+            if snapshot is not None:
+                self.draw(snapshot)
+            if snapshots.finished():
+                self.master.quit()
+            else:
+                self.master.after(period, poll)
+
+        self.master.after(0, poll)
+        self.master.mainloop()
+
+    def close(self):
+        pass
+
+    def get_sprite(self, waste_type):
+        """
+        Get the image of a waste type at the size of a cell
+        """
+        key = (waste_type, self.cell_width, self.cell_height)
+        if key not in self.sprites:
+            image = Image.open(f"images/{waste_type.lower()}_waste.png")
+            image = image.resize((self.cell_width, self.cell_height), Image.Resampling.LANCZOS)
+            self.sprites[key] = ImageTk.PhotoImage(image, master=self.master)
+        return self.sprites[key]
+
+    def draw(self, snapshot):
+        """
+        Update the canvas : the background is drawn once, then only the items of the agents
+        which appeared, moved or disappeared since the last frame are changed
+        """
+        if self.background_version != snapshot.radioactivity_version:
+            self.draw_background(snapshot)
+        positions = {}
+        for unique_id, waste_type, pos in snapshot.wastes:
+            positions[unique_id] = (True, waste_type, pos)
+        for unique_id, robot_type, pos in snapshot.robots:
+            positions[unique_id] = (False, robot_type, pos)
+
+        for agent in [a for a in self.items if a not in positions]:
+            items, _ = self.items.pop(agent)
+            for item in items:
+                self.canvas.delete(item)
+        created = False
+        for agent, (is_waste, agent_type, pos) in positions.items():
+            if agent not in self.items:
+                self.items[agent] = (self.create_items(is_waste, agent_type, pos), pos)
+                created = True
+            else:
+                items, old_pos = self.items[agent]
+                if pos != old_pos:
+                    dx = (pos[0] - old_pos[0]) * self.cell_width
+                    dy = (pos[1] - old_pos[1]) * self.cell_height
+                    for item in items:
+                        self.canvas.move(item, dx, dy)
+                    self.items[agent] = (items, pos)
+        if created:
+            # robots are drawn over the wastes
+            self.canvas.tag_raise("robot")
+
+        # text below the grid to show the current step
+        self.canvas.itemconfigure(self.step_item, text=f"Step {snapshot.step}")
+
+    def draw_background(self, snapshot):
+        """
+        Draw the cells colored by radioactivity, under the agents, as one image
+        """
+        self.canvas.delete("background")
+        image = get_background_image(snapshot.color_layer, self.cell_width, self.cell_height)
+        self.background_image = ImageTk.PhotoImage(image, master=self.master)
+        self.canvas.create_image(0, 0, image=self.background_image, anchor='nw', tags="background")
+        self.canvas.tag_lower("background")
+        self.background_version = snapshot.radioactivity_version
+
+    def create_items(self, is_waste, agent_type, pos):
+        """
+        Create the canvas items of an agent, return their ids
+        """
+        x = pos[0] * self.cell_width + self.cell_width / 2
+        y = pos[1] * self.cell_height + self.cell_height / 2
+        if is_waste:
+            # add the waste png image at the position
+            return (self.canvas.create_image(x, y, image=self.get_sprite(agent_type), anchor='center', tags="waste"),)
+        fill = 'green' if agent_type == "green" else 'yellow' if agent_type == "yellow" else 'red'
+        text_item = self.canvas.create_text(x, y, text="ඞ", fill=fill, anchor='center', font=("Helvetica", 16, "bold"), tags="robot")
+        bbox = self.canvas.bbox(text_item)
+        rect_item = self.canvas.create_rectangle(bbox, outline="white", fill="black", tags="robot")
+        self.canvas.tag_raise(text_item, rect_item)
+        return rect_item, text_item
+
+
+class FrameExporter:
+    """
+    Offscreen renderer : draws each frame in a PIL image, without Tk, and writes it as soon as it is drawn
+    so that the memory used does not depend on the length of the run.
+    The format is given by path : a .gif animation, a .mp4 video (encoded by ffmpeg, which must be installed)
+    or else a directory of PNG images. Only the steps multiple of every are exported.
+    It can be used as a context manager, and is closed when garbage collected if it was not
+    """
+
+    def __init__(self, grid, path, every=1, cell_size=20, fps=10):
+        self.closed = False
+        self.grid = grid
+        self.path = path
+        self.every = every
+        self.cell_size = cell_size
+        self.fps = fps
+        # height of the band below the grid showing the current step
+        self.label_height = 16
+        self.size = (grid.width * cell_size, grid.height * cell_size + self.label_height)
+        self.sprites = {}
+        # (radioactivity_version, image) of the last background drawn
+        self.background = None
+        self.n_frames = 0
+        extension = os.path.splitext(path)[1].lower()
+        if extension in (".gif", ".mp4"):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if extension == ".gif":
+            self.format = "gif"
+            self.file = open(path, "wb")
+            self.palette = None
+        elif extension == ".mp4":
+            self.format = "mp4"
+            if shutil.which("ffmpeg") is None:
+                raise RuntimeError("ffmpeg was not found, it is required to export a .mp4 video")
+            width, height = self.size
+            self.encoder = subprocess.Popen(
+                ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+                 "-r", str(fps), "-i", "-", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path],
+                stdin=subprocess.PIPE)
+        else:
+            self.format = "png"
+            os.makedirs(path, exist_ok=True)
+
+    def render(self, step):
+        if step % self.every == 0:
+            self.show(take_snapshot(self.grid, step))
+
+    def show(self, snapshot):
+        if snapshot.step % self.every != 0:
+            return
+        frame = self.draw(snapshot)
+        if self.format == "png":
+            frame.save(os.path.join(self.path, f"frame_{snapshot.step:06d}.png"))
+        elif self.format == "mp4":
+            self.encoder.stdin.write(frame.tobytes())
+        else:
+            self.write_gif_frame(frame)
+        self.n_frames += 1
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.format == "gif":
+            # GIF trailer
+            self.file.write(b";")
+            self.file.close()
+        elif self.format == "mp4":
+            self.encoder.stdin.close()
+            self.encoder.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # an exporter whose __init__ failed has no format, nothing to close
+        if hasattr(self, "format"):
+            self.close()
+
+    def write_gif_frame(self, frame):
+        """
+        Append a frame to the GIF file, all frames use the palette of the first one
+        """
+        duration = int(1000 / self.fps)
+        if self.palette is None:
+            self.palette = frame.quantize(256)
+            for block in GifImagePlugin.getheader(self.palette, info={"optimize": False, "loop": 0})[0]:
+                self.file.write(block)
+            image = self.palette
+        else:
+            image = frame.quantize(palette=self.palette)
+        for block in GifImagePlugin.getdata(image, duration=duration):
+            self.file.write(block)
+
+    def get_sprite(self, waste_type):
+        """
+        Get the image of a waste type at the size of a cell
+        """
+        if waste_type not in self.sprites:
+            image = Image.open(f"images/{waste_type.lower()}_waste.png").convert("RGBA")
+            self.sprites[waste_type] = image.resize((self.cell_size, self.cell_size), Image.Resampling.LANCZOS)
+        return self.sprites[waste_type]
+
+    def draw(self, snapshot):
+        """
+        Draw the grid with wastes and robots in a new RGB image
+        """
+        grid = self.grid
+        size = self.cell_size
+        frame = Image.new("RGB", self.size, "white")
+        if self.background is None or self.background[0] != snapshot.radioactivity_version:
+            self.background = (snapshot.radioactivity_version, get_background_image(snapshot.color_layer, size, size))
+        frame.paste(self.background[1], (0, 0))
+        for _, waste_type, (x, y) in snapshot.wastes:
+            sprite = self.get_sprite(waste_type)
+            frame.paste(sprite, (x * size, y * size), sprite)
+        draw = ImageDraw.Draw(frame)
+        margin = max(size // 6, 1)
+        for _, robot_type, (x, y) in snapshot.robots:
+            x, y = x * size, y * size
+            draw.rectangle((x + margin, y + margin, x + size - margin, y + size - margin), fill="black", outline="white")
+            draw.ellipse((x + 2 * margin, y + 2 * margin, x + size - 2 * margin, y + size - 2 * margin), fill=robot_type)
+        draw.text((4, grid.height * size + 2), f"Step {snapshot.step}", fill="black")
+        return frame
+
+
+class ThreadedRenderer:
+    """
+    Runs a renderer in its own thread : the model only publishes snapshots in a SnapshotQueue,
+    the renderer shows them at most fps frames per second (as fast as it can if fps is None)
+    and skips the ones it has no time for, unless drop is False : the simulation then waits for it,
+    as a FrameExporter must do to export every frame. Not for a TkRenderer, see run_live
+    """
+
+    def __init__(self, renderer, fps=None, max_size=2, drop=True):
+        self.renderer = renderer
+        self.snapshots = SnapshotQueue(renderer.grid, max_size, drop)
+        self.period = 1 / fps if fps else 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def render(self, step):
+        self.snapshots.render(step)
+
+    def run(self):
+        try:
+            while not self.snapshots.finished():
+                start = perf_counter()
+                snapshot = self.snapshots.pop()
+                if snapshot is None:
+                    sleep(0.001)
+                    continue
+                self.renderer.show(snapshot)
+                remaining = self.period - (perf_counter() - start)
+                if remaining > 0:
+                    sleep(remaining)
+        except BaseException as error:
+            # the simulation must not wait for a renderer which is gone, the error is raised again by close
+            self.error = error
+            self.snapshots.close()
+
+    def close(self):
+        self.snapshots.close()
+        self.thread.join()
+        self.renderer.close()
+        if self.error is not None:
+            raise self.error
+
+
+def run_live(model, renderer, fps=25, max_steps=None, max_size=2):
+    """
+    Run the model at full speed in a thread while renderer (a TkRenderer) shows it live in the main thread
+    An error of the simulation ends the window and is raised again in the main thread
+    """
+    snapshots = SnapshotQueue(model.grid, max_size)
+    model.attach_renderer(snapshots)
+    errors = []
+
+    def simulate():
+        try:
+            model.run_while(max_steps)
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            snapshots.close()
+
+    simulation = threading.Thread(target=simulate)
+    simulation.start()
+    renderer.play(snapshots, fps)
+    simulation.join()
+    renderer.close()
+    if len(errors) > 0:
+        raise errors[0]
@@ -1,58 +1,93 @@
 from model import Environnement, CommunicationEnvironnement, RandomEnvironnement
+from metrics import load_model_vars, load_agent_vars
+from render import FrameExporter, TkRenderer, run_live
 import seaborn as sns
+import pandas as pd
+import numpy as np
+import multiprocessing
+import itertools
 import argparse
 import os
     
 
-def main(robots_numbers = [3, 3, 3], NbWastes = 16, GridLen = 21, GridHeight = 3, OPTI = False, debug = False):
+def main(robots_numbers = [3, 3, 3], NbWastes = 16, GridLen = 21, GridHeight = 3, OPTI = False, debug = False, draw = True, seed = None,
+         metrics_dir = None, metrics_interval = 1, export = None, export_every = 1, live = False, fps = 25):
     if not os.path.exists("figures"):
         os.makedirs("figures")
     if OPTI:
-        environnement = CommunicationEnvironnement(robots_numbers, NbWastes, GridLen, GridHeight, debug)
+        environnement = CommunicationEnvironnement(robots_numbers, NbWastes, GridLen, GridHeight, debug, draw and not live, seed=seed,
+                                                   metrics_dir=metrics_dir, metrics_interval=metrics_interval)
         # environnement = Environnement(robots_numbers, NbWastes, GridLen, GridHeight, False)
         # print(environnement.grid.radioactivity_map.shape)
         # print(len(environnement.grid._grid), len(environnement.grid._grid[0]))
         
-        environnement.run_while()
+        if export is not None:
+            environnement.attach_renderer(FrameExporter(environnement.grid, export, export_every))
+        if live:
+            # the simulation runs at full speed, the window shows it at fps frames per second
+            run_live(environnement, TkRenderer(environnement.grid, delay=0), fps)
+        else:
+            environnement.run_while()
         # environnement.grid.print()
         # environnement.grid.draw()
         # environnement.master.mainloop()
-        agent_inventory = environnement.datacollector.get_agent_vars_dataframe()
-        last_step = agent_inventory.index.get_level_values('Step').max()
-        agent_inventory = agent_inventory.xs(last_step, level="Step")["Carry"]
-        print("Opti : ", last_step)
+        agent_vars = environnement.datacollector.get_agent_vars_dataframe()
+        print("Opti : ", agent_vars.index.get_level_values('Step').max())
         model_vars = environnement.datacollector.get_model_vars_dataframe()
         print("MODEL vars column : ", model_vars.columns)
-        # Number of messages sent
-        for colour in ["green", "yellow", "red"] :
-            g = sns.lineplot(data=model_vars, x=model_vars.index, y="NbMessages_"+colour, color = colour)
-            g.set(
-                xlabel="Step",
-                ylabel=f"Number of messages sent",
-                title="Number of messages sent"
-            )
-        g.figure.savefig("figures/nbmessages_sent.png")
-        # clear the figure
-        g.figure.clear()
     
     else:
         # environnement = CommunicationEnvironnement(robots_numbers, NbWastes, GridLen, GridHeight, False)
         # environnement = Environnement(robots_numbers, NbWastes, GridLen, GridHeight, debug)
-        environnement = RandomEnvironnement(robots_numbers, NbWastes, GridLen, GridHeight, debug)
+        environnement = RandomEnvironnement(robots_numbers, NbWastes, GridLen, GridHeight, debug, draw and not live, seed=seed,
+                                            metrics_dir=metrics_dir, metrics_interval=metrics_interval)
         # print(environnement.grid.radioactivity_map.shape)
         # print(len(environnement.grid._grid), len(environnement.grid._grid[0]))
         
-        environnement.run_while()
+        if export is not None:
+            environnement.attach_renderer(FrameExporter(environnement.grid, export, export_every))
+        if live:
+            # the simulation runs at full speed, the window shows it at fps frames per second
+            run_live(environnement, TkRenderer(environnement.grid, delay=0), fps)
+        else:
+            environnement.run_while()
         # environnement.grid.print()
         # environnement.grid.draw()
         # environnement.master.mainloop()
-        agent_inventory = environnement.datacollector.get_agent_vars_dataframe()
-        last_step = agent_inventory.index.get_level_values('Step').max()
-        agent_inventory = agent_inventory.xs(last_step, level="Step")["Carry"]
-        print("Non Opti : ", last_step)
+        agent_vars = environnement.datacollector.get_agent_vars_dataframe()
+        print("Non Opti : ", agent_vars.index.get_level_values('Step').max())
         model_vars = environnement.datacollector.get_model_vars_dataframe()
         print("MODEL vars column : ", model_vars.columns)
 
+    plot_results(model_vars, agent_vars, OPTI)
+
+
+def plot_from(metrics_dir):
+    """
+    Plot the metrics streamed to metrics_dir by a previous run
+    """
+    if not os.path.exists("figures"):
+        os.makedirs("figures")
+    model_vars = load_model_vars(metrics_dir)
+    plot_results(model_vars, load_agent_vars(metrics_dir), "NbMessages_green" in model_vars.columns)
+
+
+def plot_results(model_vars, agent_vars, OPTI):
+    last_step = agent_vars.index.get_level_values('Step').max()
+    agent_inventory = agent_vars.xs(last_step, level="Step")["Carry"]
+    if OPTI:
+        # Number of messages sent
+        for colour in ["green", "yellow", "red"] :
+            g = sns.lineplot(data=model_vars, x=model_vars.index, y="NbMessages_"+colour, color = colour)
+            g.set(
+                xlabel="Step",
+                ylabel=f"Number of messages sent",
+                title="Number of messages sent"
+            )
+        g.figure.savefig("figures/nbmessages_sent.png")
+        # clear the figure
+        g.figure.clear()
+
 
     # Number of waste carried by each robot
     g = sns.histplot(agent_inventory, discrete=True)
@@ -89,22 +124,93 @@ def main(robots_numbers = [3, 3, 3], NbWastes = 16, GridLen = 21, GridHeight = 3
     # clear the figure
     g.figure.clear()
 
+def run_replication(params):
+    """
+    Run one headless simulation and return its final state
+    params : dict with robots_numbers, NbWastes, GridLen, GridHeight, OPTI, seed and max_steps
+    """
+    Environnement_class = CommunicationEnvironnement if params["OPTI"] else RandomEnvironnement
+    environnement = Environnement_class(list(params["robots_numbers"]), params["NbWastes"], params["GridLen"], params["GridHeight"], draw=False, seed=params["seed"])
+    environnement.run_while(params["max_steps"])
+    last = environnement.datacollector.get_model_vars_dataframe().iloc[-1]
+    green, yellow, red = params["robots_numbers"]
+    result = {"green_robot": green, "yellow_robot": yellow, "red_robot": red,
+              "NbWastes": params["NbWastes"], "GridLen": params["GridLen"], "GridHeight": params["GridHeight"],
+              "OPTI": params["OPTI"], "replication": params["replication"], "seed": params["seed"],
+              "steps": environnement.schedule.steps, "terminated": environnement.terminated()}
+    for column, value in last.items():
+        result[column] = value
+    return result
+
+
+def run_batch(robots_numbers_list = [[3, 3, 3]], NbWastes_list = [16], GridLen_list = [21], GridHeight_list = [3], OPTI_list = [True, False],
+              replications = 10, seed = None, processes = None, max_steps = 1000):
+    """
+    Run replications of the simulation for every combination of the parameters, on a pool of processes
+    Each run gets its own seed, drawn from the base seed, and recorded in the results
+    Returns one row per run, and the mean and std of each result per combination of parameters
+    """
+    combinations = list(itertools.product(robots_numbers_list, NbWastes_list, GridLen_list, GridHeight_list, OPTI_list))
+    seeds = np.random.SeedSequence(seed).spawn(len(combinations) * replications)
+    runs = []
+    for (robots_numbers, NbWastes, GridLen, GridHeight, OPTI), i in itertools.product(combinations, range(replications)):
+        runs.append({"robots_numbers": tuple(robots_numbers), "NbWastes": NbWastes, "GridLen": GridLen, "GridHeight": GridHeight,
+                     "OPTI": OPTI, "replication": i, "seed": int(seeds[len(runs)].generate_state(1)[0]), "max_steps": max_steps})
+    with multiprocessing.Pool(processes) as pool:
+        results = pd.DataFrame(pool.map(run_replication, runs, chunksize=1))
+    parameters = ["green_robot", "yellow_robot", "red_robot", "NbWastes", "GridLen", "GridHeight", "OPTI"]
+    summary = results.drop(columns=["replication", "seed"]).groupby(parameters).agg(["mean", "std"])
+    return results, summary
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description = 'Choose the parameters for the simulation')
 
     # Ajoute tous les paramètres de la fonction main
-    parser.add_argument('--green_robot', type=int, default=5, help='Number of green robots')
-    parser.add_argument('--yellow_robot', type=int, default=3, help='Number of yellow robots')
-    parser.add_argument('--red_robot', type=int, default=3, help='Number of red robots')
-    parser.add_argument('--nb_wastes', type=int, default=16, help='Number of wastes')
-    parser.add_argument('--grid_width', type=int, default=21, help='Grid length')
-    parser.add_argument('--grid_height', type=int, default=3, help='Grid height')
-    parser.add_argument('--opti', type=str, default="True", help='Optimised version')
+    # En mode batch (--replications), plusieurs valeurs peuvent être données pour chaque paramètre
+    parser.add_argument('--green_robot', type=int, nargs='+', default=[5], help='Number of green robots')
+    parser.add_argument('--yellow_robot', type=int, nargs='+', default=[3], help='Number of yellow robots')
+    parser.add_argument('--red_robot', type=int, nargs='+', default=[3], help='Number of red robots')
+    parser.add_argument('--nb_wastes', type=int, nargs='+', default=[16], help='Number of wastes')
+    parser.add_argument('--grid_width', type=int, nargs='+', default=[21], help='Grid length')
+    parser.add_argument('--grid_height', type=int, nargs='+', default=[3], help='Grid height')
+    parser.add_argument('--opti', type=str, nargs='+', default=["True"], help='Optimised version')
     parser.add_argument('--debug', type=str, default="False", help='Debug mode')
+    parser.add_argument('--draw', type=str, default="True", help='Show the grid in a Tk window, False runs headless')
+    parser.add_argument('--replications', type=int, default=0, help='Number of headless runs per combination of parameters, 0 for a single run')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the run, or base seed of the replications')
+    parser.add_argument('--processes', type=int, default=None, help='Number of processes of the replications, all cores by default')
+    parser.add_argument('--max_steps', type=int, default=1000, help='Maximum number of steps of a replication')
+    parser.add_argument('--metrics_dir', type=str, default=None, help='Stream the metrics to this directory instead of keeping them in memory')
+    parser.add_argument('--metrics_interval', type=int, default=1, help='Record the metrics every n steps')
+    parser.add_argument('--export', type=str, default=None, help='Save the frames of the run : a .gif, a .mp4 (needs ffmpeg) or a directory of PNG images')
+    parser.add_argument('--export_every', type=int, default=1, help='Save a frame every n steps')
+    parser.add_argument('--live', type=str, default="False", help='Run the simulation at full speed in a thread, the Tk window follows it')
+    parser.add_argument('--fps', type=int, default=25, help='Frames per second of the live window')
+    parser.add_argument('--plot_from', type=str, default=None, help='Only plot the metrics streamed to this directory by a previous run')
     # Run la fonction main avec ces paramètres
     args = parser.parse_args()
-    opti = True if args.opti.lower() == "true" else False
+    opti = [True if o.lower() == "true" else False for o in args.opti]
     debug = True if args.debug.lower() == "true" else False
-    main([args.green_robot, args.yellow_robot, args.red_robot], args.nb_wastes, args.grid_width, args.grid_height, opti, debug)
+    draw = True if args.draw.lower() == "true" else False
+    live = True if args.live.lower() == "true" else False
+    if args.plot_from is not None:
+        plot_from(args.plot_from)
+    elif args.replications > 0:
+        if not os.path.exists("figures"):
+            os.makedirs("figures")
+        robots_numbers = [list(r) for r in itertools.product(args.green_robot, args.yellow_robot, args.red_robot)]
+        results, summary = run_batch(robots_numbers, args.nb_wastes, args.grid_width, args.grid_height, opti,
+                                     args.replications, args.seed, args.processes, args.max_steps)
+        results.to_csv("figures/replications.csv", index=False)
+        summary.to_csv("figures/replications_summary.csv")
+        print(summary)
+    else:
+        # a single run takes one value per parameter
+        for name in ("green_robot", "yellow_robot", "red_robot", "nb_wastes", "grid_width", "grid_height", "opti"):
+            if len(getattr(args, name)) > 1:
+                parser.error(f"--{name} takes several values only with --replications")
+        main([args.green_robot[0], args.yellow_robot[0], args.red_robot[0]], args.nb_wastes[0], args.grid_width[0], args.grid_height[0], opti[0], debug, draw, args.seed,
+             args.metrics_dir, args.metrics_interval, args.export, args.export_every, live, args.fps)
 
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Testing the simulation modules : batch engine, metrics, renderers and schedulers.
+Run from the root of the project : python runtests.py
+"""
+
+import glob
+import os
+import tempfile
+import warnings
+from PIL import Image
+
+from batch import BatchEnvironnement
+from metrics import load_agent_vars, load_model_vars
+from model import Environnement, CommunicationEnvironnement
+from objects import DisposalZone, WasteAgent
+from render import FrameExporter, SnapshotQueue, ThreadedRenderer
+
+# mesa warns that its AgentSet is experimental at each model created
+warnings.simplefilter("ignore", FutureWarning)
+
+
+if __name__ == "__main__":
+    print("*---- Testing the simulation ----")
+    print("*")
+    print("* 1) Testing BatchEnvironnement")
+
+    for random_policy in (False, True):
+        batch = BatchEnvironnement([3, 3, 3], 16, 21, 3, random_policy=random_policy, seed=0)
+        batch.run_while(3000)
+        assert(batch.terminated())
+        same_seed = BatchEnvironnement([3, 3, 3], 16, 21, 3, random_policy=random_policy, seed=0)
+        same_seed.run_while(3000)
+        assert(same_seed.steps == batch.steps and same_seed.full_recycled == batch.full_recycled)
+    print("*     run_while() terminates, the same seed gives the same run => OK")
+
+    print("* 2) Testing StreamingCollector")
+
+    in_memory = Environnement([5, 3, 3], 16, 21, 3, draw=False, seed=0)
+    in_memory.run_while()
+    metrics_dir = tempfile.mkdtemp()
+    streamed = Environnement([5, 3, 3], 16, 21, 3, draw=False, seed=0, metrics_dir=metrics_dir)
+    # small chunks, so that the metrics are read back from several files
+    streamed.datacollector.chunk_size = 4
+    streamed.run_while()
+    assert(len(glob.glob(os.path.join(metrics_dir, "model_*.npz"))) > 1)
+    expected_model_vars = in_memory.datacollector.get_model_vars_dataframe()
+    expected_agent_vars = in_memory.datacollector.get_agent_vars_dataframe()
+    for model_vars, agent_vars in ((streamed.datacollector.get_model_vars_dataframe(), streamed.datacollector.get_agent_vars_dataframe()),
+                                   (load_model_vars(metrics_dir), load_agent_vars(metrics_dir))):
+        assert(list(model_vars.index) == list(expected_model_vars.index))
+        assert((model_vars.values == expected_model_vars.values).all())
+        assert(agent_vars.index.equals(expected_agent_vars.index))
+        assert((agent_vars["Carry"].values == expected_agent_vars["Carry"].values).all())
+    print("*     same metrics as DataCollector, read back from the chunks => OK")
+
+    partial = Environnement([5, 3, 3], 16, 21, 3, draw=False, seed=0, metrics_dir=tempfile.mkdtemp())
+    partial.run_n_steps(10)
+    assert(len(load_model_vars(partial.metrics_dir)) == 10)
+    print("*     run_n_steps() writes the metrics of a partial run => OK")
+
+    print("* 3) Testing FrameExporter")
+
+    export_dir = tempfile.mkdtemp()
+    exported = Environnement([5, 3, 3], 16, 21, 3, draw=False, seed=0)
+    exported.attach_renderer(FrameExporter(exported.grid, os.path.join(export_dir, "frames"), every=2))
+    exported.attach_renderer(FrameExporter(exported.grid, os.path.join(export_dir, "run.gif"), every=2))
+    exported.run_while()
+    n_frames = exported.schedule.steps // 2
+    assert(len(os.listdir(os.path.join(export_dir, "frames"))) == n_frames)
+    with Image.open(os.path.join(export_dir, "run.gif")) as gif:
+        assert(gif.n_frames == n_frames)
+    print("*     PNG and GIF export of one step out of two => OK")
+
+    print("* 4) Testing SnapshotQueue & ThreadedRenderer")
+
+    queue = SnapshotQueue(exported.grid, max_size=2)
+    for step in range(5):
+        queue.render(step)
+    assert([queue.pop().step, queue.pop().step] == [3, 4] and queue.pop() is None)
+    assert(queue.get_dropped() == 3)
+    queue.close()
+    assert(queue.finished())
+    print("*     the oldest snapshots are dropped when the queue is full => OK")
+
+    threaded_dir = os.path.join(tempfile.mkdtemp(), "frames")
+    threaded = Environnement([5, 3, 3], 16, 21, 3, draw=False, seed=0)
+    threaded.attach_renderer(ThreadedRenderer(FrameExporter(threaded.grid, threaded_dir), drop=False))
+    threaded.run_while()
+    assert(len(os.listdir(threaded_dir)) == threaded.schedule.steps)
+    print("*     ThreadedRenderer(drop=False) exports every frame => OK")
+
+    painted = Environnement([5, 3, 3], 16, 21, 3, draw=False, seed=0)
+    painter = FrameExporter(painted.grid, os.path.join(tempfile.mkdtemp(), "frames"), cell_size=10)
+    queue = SnapshotQueue(painted.grid)
+    queue.render(0)
+    before = painter.draw(queue.pop()).getpixel((5, 5))
+    queue.render(1)
+    painted.grid.set_radioactivity((0, 0), 10)
+    assert(painter.draw(queue.pop()).getpixel((5, 5)) == before)
+    queue.render(2)
+    assert(painter.draw(queue.pop()).getpixel((5, 5)) != before)
+    painter.close()
+    print("*     the background is the one of the snapshot, not the one of the live grid => OK")
+
+    print("* 5) Testing RobotActivation")
+
+    def inert_step(agent):
+        raise AssertionError(f"inert agent {agent.unique_id} was stepped")
+
+    waste_step, disposal_step = WasteAgent.step, DisposalZone.step
+    WasteAgent.step = DisposalZone.step = inert_step
+    for staged in (False, True):
+        scheduled = Environnement([5, 3, 3], 16, 21, 3, draw=False, seed=0, staged_activation=staged)
+        disposal = DisposalZone(scheduled.next_id(), scheduled, (20, 0))
+        scheduled.schedule.add(disposal)
+        assert(all(not isinstance(agent, (WasteAgent, DisposalZone)) for agent in scheduled.schedule.agents))
+        assert(disposal in scheduled.schedule.get_inert_agents())
+        assert(len(scheduled.schedule.get_inert_agents()) == 1 + sum(scheduled.waste_counts.values()))
+        scheduled.run_while()
+        assert(scheduled.terminated())
+    WasteAgent.step, DisposalZone.step = waste_step, disposal_step
+    print("*     the wastes and the disposal zone are never stepped, staged or not => OK")
+
+    print("* 6) Testing SimultaneousRobotActivation")
+
+    def trajectory(environnement_class, workers):
+        simultaneous = environnement_class([8, 8, 6], 60, 30, 6, draw=False, seed=4, simultaneous=True, workers=workers)
+        positions = []
+        while not simultaneous.terminated() and simultaneous.schedule.steps < 3000:
+            simultaneous.one_step()
+            positions.append(sorted((robot.unique_id, robot.pos, len(robot.inventory)) for robot in simultaneous.get_robots()))
+        simultaneous.schedule.close()
+        assert(simultaneous.terminated())
+        return positions
+
+    for environnement_class in (Environnement, CommunicationEnvironnement):
+        assert(trajectory(environnement_class, None) == trajectory(environnement_class, 4))
+    print("*     same run with workers=None and workers=4, which terminates => OK")
+
+    exchanging = CommunicationEnvironnement([2, 0, 0], 3, 9, 3, draw=False, seed=0, simultaneous=True)
+    robot_a, robot_b = exchanging.get_robots()
+    waste_a, waste_b = exchanging.grid.get_wastes()["green"][:2]
+    exchanging.grid.move_agent(robot_a, (1, 1))
+    exchanging.grid.move_agent(robot_b, (2, 1))
+    for robot, waste in ((robot_a, waste_a), (robot_b, waste_b)):
+        exchanging.grid.remove_agent(waste)
+        robot.inventory.append(waste)
+    exchanging.resolve([(robot_a, {"action": "take", "waste": waste_a, "src": robot_b}),
+                        (robot_b, {"action": "take", "waste": waste_b, "src": robot_a})])
+    assert(len(robot_a.inventory) == 2 and len(robot_b.inventory) == 0)
+    print("*     two robots taking from each other : only the first take is applied => OK")
+
+    print("* 7) Testing the coalescing of the claims")
+
+    coalesced = CommunicationEnvironnement([5, 3, 3], 16, 21, 3, draw=False, seed=0)
+    coalesced.run_while()
+    assert(coalesced.terminated() and coalesced.message_service.get_suppressed_count() > 0)
+    delayed = CommunicationEnvironnement([5, 3, 3], 16, 21, 3, draw=False, seed=0, message_latency=2)
+    assert(delayed.coalescing_window == delayed.message_timeout)
+    delayed.run_while()
+    assert(delayed.terminated())
+    print("*     the repeated claims are dropped, for no longer than message_timeout => OK")
+
+    print("* 8) Testing the nearest-waste index")
+
+    searched = Environnement([5, 3, 3], 30, 21, 6, draw=False, seed=0)
+    known = searched.grid.get_wastes()
+    indexes = searched.grid.get_waste_indexes(known)
+    picked = known["green"][0]
+    searched.grid.remove_agent(picked)
+    for x in range(21):
+        for y in range(6):
+            for color, wastes in known.items():
+                wastes = [w for w in wastes if w is not picked]
+                expected = min(wastes, key=lambda w: searched.grid.get_distance((x, y), w.pos))
+                assert(indexes[color].nearest((x, y)) == [expected])
+    print("*     same waste as min() over the knowledge, ties included, without the ones picked up since => OK")
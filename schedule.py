@@ -0,0 +1,125 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from mesa.time import RandomActivation
+
+from objects import WasteAgent, DisposalZone
+from mesa_com.communication import CommunicatingAgent
+
+#######################
+###### Schedulers #####
+#######################
+
+class RobotActivation(RandomActivation):
+    """
+    Scheduler which only activates the agents that act, in a random order.
+    Inert agents (wastes, disposal zone) are kept in a separate registry : they can be added and removed
+    like any agent, but are neither shuffled nor stepped, so a step costs the number of robots.
+    With staged=True the robots are activated type by type, in the order of stages, shuffled within each type
+    """
+
+    def __init__(self, model, staged=False, stages=("green", "yellow", "red"), inert_types=(WasteAgent, DisposalZone)):
+        super().__init__(model)
+        self.staged = staged
+        self.stages = stages
+        self.inert_types = inert_types
+        # dict used as an ordered set of the inert agents
+        self.inert = {}
+
+    def add(self, agent):
+        if isinstance(agent, self.inert_types):
+            if agent in self.inert:
+                raise ValueError("agent already added to scheduler")
+            self.inert[agent] = None
+        else:
+            super().add(agent)
+
+    def remove(self, agent):
+        if agent in self.inert:
+            del self.inert[agent]
+        else:
+            super().remove(agent)
+
+    def get_inert_agents(self):
+        """
+        Get the inert agents of the schedule (the agents property only holds the active ones)
+        """
+        return list(self.inert)
+
+    def step(self):
+        if not self.staged:
+            super().step()
+            return
+        stages = {stage: [] for stage in self.stages}
+        for agent in self._agents:
+            stages.setdefault(getattr(agent, "type", None), []).append(agent)
+        for agents in stages.values():
+            self.model.random.shuffle(agents)
+            for agent in agents:
+                agent.step()
+        self.steps += 1
+        self.time += 1
+
+    def close(self):
+        pass
+
+
+class SimultaneousRobotActivation(RobotActivation):
+    """
+    Two-phase activation : every robot perceives the grid as it is at the beginning of the step and
+    deliberates on this same state (in a pool of workers threads if workers > 1), then the model applies
+    all the decisions in a random order, dropping the ones made invalid by the decisions applied before.
+    Each robot gets its own random generator, seeded by the model, so that the run does not depend
+    on the order in which the threads deliberate. Communicating robots deliberate one after the other,
+    in the order of their ids, as sending a message changes the mailboxes of the other robots.
+    With staged=True the decisions are applied type by type, in the order of stages, shuffled within each type
+    """
+
+    def __init__(self, model, workers=None, staged=False, stages=("green", "yellow", "red"),
+                 inert_types=(WasteAgent, DisposalZone)):
+        super().__init__(model, staged=staged, stages=stages, inert_types=inert_types)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers) if workers is not None and workers > 1 else None
+
+    def add(self, agent):
+        super().add(agent)
+        if agent not in self.inert:
+            agent.rng = random.Random(self.model.random.getrandbits(64))
+
+    def step(self):
+        robots = sorted(self._agents, key=lambda a: a.unique_id)
+        # perception : one frozen copy of the registries, shared by all the robots
+        wastes = self.model.grid.get_wastes()
+        others = self.model.grid.get_robots()
+        for robot in robots:
+            robot.percepts = self.model.perceive(robot, wastes, others)
+            robot.update_knowledge()
+        # deliberation : nothing is changed on the grid until every robot has decided
+        decisions = {}
+        independent = [robot for robot in robots if not isinstance(robot, CommunicatingAgent)]
+        if self.executor is not None:
+            for robot, decision in zip(independent, self.executor.map(lambda r: r.deliberate(r.knowledge), independent)):
+                decisions[robot] = decision
+        else:
+            for robot in independent:
+                decisions[robot] = robot.deliberate(robot.knowledge)
+        for robot in robots:
+            if robot not in decisions:
+                decisions[robot] = robot.deliberate(robot.knowledge)
+        # resolution
+        if self.staged:
+            stages = {stage: [] for stage in self.stages}
+            for robot in robots:
+                stages.setdefault(getattr(robot, "type", None), []).append(robot)
+            robots = []
+            for stage in stages.values():
+                self.model.random.shuffle(stage)
+                robots.extend(stage)
+        else:
+            self.model.random.shuffle(robots)
+        self.model.resolve([(robot, decisions[robot]) for robot in robots])
+        self.steps += 1
+        self.time += 1
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()